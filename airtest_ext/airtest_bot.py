@@ -2,14 +2,20 @@
 # -*-coding: UTF-8 -*-
 # airtest 机器人框架
 #
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from airtest_ext.debug_wnd import DebugWindow
 from mitmproxy import http
 from airtest_ext.mitmproxy_svr import MitmDumpThread
+from airtest_ext.mitm_workers import MitmWorkerPool
+from airtest_ext.capture_svr import ScreenCaptureThread
 from frida_hooks.agent import FridaAgent
 from frida_hooks.utils import get_host
 
 from airtest_ext.interceptor_mgr import InterceptorMgr
+from airtest_ext.flow_archive import FlowArchive
+from airtest_ext.data_filter import Filter, FilterMatcher, get_host_regexes
 from airtest_ext.page import *
 import logging
 
@@ -17,41 +23,7 @@ import logging
 class FeatureNotFoundException(BaseException): pass
 
 
-class Filter:
-    """
-    定义截包数据过滤规则
-    """
-
-    def __init__(self, data_name, url_regex, once_only=True):
-        """
-        :param data_name: 数据名称
-        :param url_regex: url正则
-        :param once_only: 是否是仅订阅（过滤）一次
-        """
-        self._data_name = data_name
-        self._url_regex = url_regex
-        self._once_only = once_only
-        self._datas = []
-
-    @property
-    def data_name(self):
-        return self._data_name
-
-    @property
-    def url_regex(self):
-        return self._url_regex
-
-    @property
-    def once_only(self):
-        return self._once_only
-
-    @property
-    def datas(self):
-        return self._datas
-
-    @datas.setter  # 实现一个age相关的setter方法
-    def datas(self, datas):
-        self._datas = datas
+class MitmproxyStartException(BaseException): pass
 
 
 class Feature:
@@ -89,7 +61,9 @@ class AirtestBot:
     """
 
     def __init__(self, device_id='', app_name=None, start_mitmproxy=False, intercept_all=False,
-                 show_dbg_wnd=False, log_level=logging.WARN):
+                 show_dbg_wnd=False, log_level=logging.WARN, match_workers=0,
+                 background_capture=False, async_intercept=False, mitmproxy_workers=0,
+                 archive_path=None, replay_path=None, selective_intercept=False, intercept_hosts=None):
         """
         :param device_id: 手机的设备ID
         :param app_name: 应用安装包的内部名称
@@ -97,6 +71,22 @@ class AirtestBot:
         :param intercept_all: 是否拦截所有mitmproxy上所有IP的请求，默认：False，仅拦截当前设备的请求
         :param show_dbg_wnd: 是否开启调试窗口，默认：False。注意，开始后内部调试语句，如dbg.pause()，会生效
         :param log_level: 日志等级，默认：logging.WARN
+        :param match_workers: 并行匹配特征图数组的线程数，默认：0，即不启用并行匹配
+        :param background_capture: 是否开启后台截屏线程，开启后匹配时直接读取最新帧，默认：False
+        :param async_intercept: 是否在独立线程中异步执行拦截回调，开启后mitmproxy无需等待回调完成，
+                                但回调无法修改请求/响应，默认：False
+        :param mitmproxy_workers: mitmdump工作进程数，大于0时以多进程方式运行mitmproxy，各进程依次监听
+                                  mitmproxy_port、mitmproxy_port+1...，回调无法修改请求/响应，默认：0，即在本进程中运行
+        :param archive_path: 截包数据归档文件路径，设置后将匹配到订阅过滤器的流追加保存到该文件，参见FlowArchive，
+                             默认：None，即不归档
+        :param replay_path: 回放的归档文件路径，设置后mitmproxy用归档的流应答请求，不访问真实的服务器，
+                            用于离线测试，默认：None，即不回放
+        :param selective_intercept: 是否只解密订阅的主机的请求，其余主机的连接直接透传，默认：False。
+                                    主机名从订阅的过滤器的url正则中解析（本次运行中订阅过的主机一直解密），
+                                    有过滤器无法解析时解密全部请求；在订阅之前已建立的透传连接不受订阅的影响，
+                                    应用启动后才订阅的主机建议通过intercept_hosts预先指定。
+                                    多进程方式运行mitmproxy时只支持由intercept_hosts指定主机
+        :param intercept_hosts: selective_intercept开启时要解密的主机名数组，默认：None，即从订阅的过滤器中解析
         :param **kwargs: 平台关键词`kwargs`, 用户可以附加额外参数，这些参数则会传递给锚点目标页面的脚本
         """
         self._device_id = device_id
@@ -108,16 +98,34 @@ class AirtestBot:
         self._frida_agent = FridaAgent()
         self._start_mitmproxy_svr = start_mitmproxy
         self._intercept_all = intercept_all
+        self._async_intercept = async_intercept
+        self._mitmproxy_workers = mitmproxy_workers
+        self._archive_path = archive_path
+        self._flow_archive = None
+        self._replay_path = replay_path
+        self._selective_intercept = selective_intercept
+        self._intercept_hosts = intercept_hosts
+        # 本次运行中订阅过的所有主机（只增不减），为None时表示有过滤器无法解析出主机名，解密全部连接
+        self._subscribed_hosts = []
         self._mitmproxy_svr = None
         self._interceptor_id = None
         self._data_filters = {}
+        self._filter_matcher = FilterMatcher([])
         self._lock = threading.RLock()
-        self._data_event = threading.Event()
+        # 等待任意数据的线程使用的条件变量及数据序号
+        self._data_cond = threading.Condition()
+        self._data_seq = 0
         self._page_paths = []
         self._dbg_wnd = DebugWindow()
         self._show_dbg_wnd = show_dbg_wnd
         self._features = {}
         self._pages = {}
+        self._page_classifier = None
+        self._match_workers = match_workers
+        self._match_executor = None
+        self._extract_executor = None
+        self._background_capture = background_capture
+        self._capture_svr = None
 
     @property
     def features(self):
@@ -142,6 +150,7 @@ class AirtestBot:
     def pages(self, pages):
         for page in pages:
             self._pages[page.name] = page
+        self._page_classifier = None
 
     def get_page(self, name):
         if name in self._pages:
@@ -149,6 +158,26 @@ class AirtestBot:
         else:
             raise_exception(PageNotFoundException(f"程序异常：页面[{name}]没有定义，请检查有无定义该页面或是否加入到Bot类中!"))
 
+    def get_page_classifier(self):
+        """
+        获取由所有页面及片段的特征图构建的页面分类器，页面变化后重新构建
+
+        :return: PageClassifier实例
+        """
+        if self._page_classifier is None:
+            self._page_classifier = PageClassifier(self._pages.values())
+        return self._page_classifier
+
+    def _get_current_page(self, timeout=0):
+        """
+        识别当前页面，每次尝试只截屏一次
+
+        :param timeout: 等待超时时间，默认：0，即只识别一次
+        :return: (页面, 片段)，片段为None时表示页面本身，无法识别时返回None
+        """
+        results = self.get_page_classifier().wait(timeout=timeout)
+        return results[0][:2] if len(results) > 0 else None
+
     def init(self, mitmproxy_port=8089, debug=True):
         if self._device_id == '':
             self._frida_agent.init_device(self._device_id)
@@ -156,11 +185,21 @@ class AirtestBot:
 
         self._device = auto_setup(__file__, logdir=False,
                                   device_uri=f"android://127.0.0.1:5037/{self._device_id}?cap_method=MINICAP&&ori_method=MINICAPORI&&touch_method=MINITOUCH")
-        if self._app_name is not None and self._app_name != '':
-            start_app(self._app_name, device=self._device)
+        if self._background_capture:
+            self._capture_svr = ScreenCaptureThread(self._device)
+            self._capture_svr.start()
+            set_screen_capture(self._capture_svr, device=self._device)
 
-        if self._start_mitmproxy_svr:
-            self._start_mitmproxy(port=mitmproxy_port, debug=debug)
+        if self._match_workers > 0:
+            self._match_executor = ThreadPoolExecutor(max_workers=self._match_workers,
+                                                      thread_name_prefix='airtest matcher')
+            set_match_executor(self._match_executor, device=self._device)
+
+        if self._archive_path is not None:
+            self._flow_archive = FlowArchive(self._archive_path)
+
+        if self._start_mitmproxy_svr and not self._start_mitmproxy(port=mitmproxy_port, debug=debug):
+            raise_exception(MitmproxyStartException(f"程序异常：mitmproxy 未能在端口 {mitmproxy_port} 上开始监听！"))
 
         # 设置日志级别
         logger = logging.getLogger("airtest")
@@ -168,12 +207,35 @@ class AirtestBot:
 
         self._register_interceptor()
 
+        # mitmproxy开始监听、拦截器注册之后再启动应用，避免漏掉应用启动时的请求
+        if self._app_name is not None and self._app_name != '':
+            start_app(self._app_name, device=self._device)
+
     def uninit(self):
         self._unregister_interceptor()
 
         if self._start_mitmproxy_svr:
             self._stop_mitmproxy()
 
+        if self._flow_archive is not None:
+            self._flow_archive.close()
+            self._flow_archive = None
+
+        if self._capture_svr is not None:
+            set_screen_capture(None, device=self._device)
+            self._capture_svr.stop()
+            self._capture_svr.join()
+            self._capture_svr = None
+
+        if self._extract_executor is not None:
+            self._extract_executor.shutdown(wait=False)
+            self._extract_executor = None
+
+        if self._match_executor is not None:
+            set_match_executor(None, device=self._device)
+            self._match_executor.shutdown(wait=False)
+            self._match_executor = None
+
         self._frida_agent.exit()
 
     def run(self, **kwargs):
@@ -209,17 +271,18 @@ class AirtestBot:
             home_anchor = self._features[home_anchor].feature if isinstance(home_anchor, str) else home_anchor
         goto_home_page(feature, device=self._device, home_anchor=home_anchor)
 
-    def _touch(self, v, timeout=10):
+    def _touch(self, v, timeout=10, poll=None):
         """
         点击屏幕
 
         :param v: 屏幕上的特征图或特征图名称或位置, 支持Template实例、绝对坐标(x, y)及相对坐标（x, y)，搜索模式下不支持Template。相对坐标从上至下、从左至右对应-1~1区间
         :param timeout: 匹配锚点图片时的等待超时时间，当没有特征图时，则点击指定位置后，也会等待该超时时间
+        :param poll: 匹配特征图时的轮询策略，PollStrategy实例，默认：None
         :return: 无
         """
         feature = self._features[v].feature if isinstance(v, str) else v
         in_rect = self._features[v].in_rect if isinstance(v, str) else None
-        touch(feature, device=self._device, in_rect=in_rect, timeout=timeout)
+        touch(feature, device=self._device, in_rect=in_rect, timeout=timeout, poll=poll)
 
     def _text(self, text, enter=True):
         """
@@ -275,33 +338,47 @@ class AirtestBot:
         """
         snapshot(device=self._device, filename=filename, msg=msg, quality=quality, max_size=max_size)
 
-    def _wait(self, v, timeout=10):
+    def _wait(self, v, timeout=10, poll=None):
         """
         等待给定的目标出现在屏幕上，直到超时为止
 
         :param v: 目标特征图或特征图名称
         :param timeout: 等待匹配图像的超时时间，默认：None（内部是20秒)
+        :param poll: 轮询策略，PollStrategy实例，默认：None
         :return: 无
         """
         feature = self._features[v].feature if isinstance(v, str) else v
         in_rect = self._features[v].in_rect if isinstance(v, str) else None
-        wait(feature, device=self._device, in_rect=in_rect, timeout=timeout)
+        wait(feature, device=self._device, in_rect=in_rect, timeout=timeout, poll=poll)
 
-    def _exists(self, v, timeout=10):
+    def _exists(self, v, timeout=10, poll=None):
         """
         检查给定的目标是否在屏幕上存在，如果不存在会一直等到超时为止
 
         :param v: 目标特征图或特征图名称
         :param timeout: 等待匹配图像的超时时间，默认：None（内部是20秒)
+        :param poll: 轮询策略，PollStrategy实例，默认：None
         :return: 匹配信息，包括坐标、信度等
         """
         feature = self._features[v].feature if isinstance(v, str) else v
         in_rect = self._features[v].in_rect if isinstance(v, str) else None
-        return exists(feature, device=self._device, in_rect=in_rect, timeout=timeout)
+        return exists(feature, device=self._device, in_rect=in_rect, timeout=timeout, poll=poll)
+
+    def _exists_features(self, names, timeout=10):
+        """
+        截取一次屏幕批量检查多个特征，如果都不存在会一直等到超时为止
+
+        :param names: 特征名称数组
+        :param timeout: 等待匹配图像的超时时间，默认：10
+        :return: 匹配结果字典 {特征名称: 匹配信息}，未匹配到的特征对应False
+        """
+        features = [self.get_feature(name) for name in names]
+        return exists_features(features, device=self._device, timeout=timeout)
 
     def _swipe(self, v, v2=None, vector=None, search_mode=False, search_f=None, bottom_f=None,
                search_in_rect=None, before_swipe=None, after_swipe=None, on_result=None, max_error_rate=None,
-               max_hit_count=0, max_swipe_count=0, min_confidence=0.95, interval=1):
+               max_hit_count=0, max_swipe_count=0, min_confidence=0.95, interval=1, stop_when_still=True,
+               adaptive_swipe=False, stitch_mode=False, pipelined=False):
         """
         在手机屏幕上模拟滑动
 
@@ -329,6 +406,10 @@ class AirtestBot:
         :param max_swipe_count: 滑动搜索模式下，设定滑动次数
         :param min_confidence: 滑动搜索模式下，设定匹配图片的信度阈值
         :param interval: 滑动搜索模式下，设定滑动间隔时间，单位为秒
+        :param stop_when_still: 滑动搜索模式下，连续两次滑动后列表都没有移动（已到底部）时自动结束，默认：True
+        :param adaptive_swipe: 滑动搜索模式下，按相邻两帧的重叠程度自动加长或缩短滑动距离，默认：False
+        :param stitch_mode: 滑动搜索模式下，将各帧拼接为虚拟的长画布，每次只在新出现的区域中匹配，默认：False
+        :param pipelined: 滑动搜索模式下，匹配与下一次滑动并行进行，仅适用于回调中不点击屏幕的场景，默认：False
         :param **kwargs: platform specific `kwargs`, please refer to corresponding docs
         :raise Exception: general exception when not enough parameters to perform swap action have been provided
         :return: Origin position and target position
@@ -353,7 +434,8 @@ class AirtestBot:
                      bottom_f=bottom_f, search_in_rect=search_in_rect, before_swipe=before_swipe,
                      after_swipe=after_swipe, on_result=on_result, max_error_rate=max_error_rate,
                      max_hit_count=max_hit_count, max_swipe_count=max_swipe_count, min_confidence=min_confidence,
-                     interval=interval)
+                     interval=interval, stop_when_still=stop_when_still, adaptive_swipe=adaptive_swipe,
+                     stitch_mode=stitch_mode, pipelined=pipelined)
 
     def _go_back(self, action=None):
         """
@@ -372,49 +454,103 @@ class AirtestBot:
             filters = filters if isinstance(filters, list) else [filters]
             for f in filters:
                 if f.data_name in self._data_filters:
-                    f.datas = self._data_filters[f.data_name].datas
+                    old_filter = self._data_filters[f.data_name]
+                    if old_filter is not f:
+                        f.datas = old_filter.drain()
+                        old_filter.close()
                 self._data_filters[f.data_name] = f
-            self._data_event.clear()
+            self._update_filter_matcher()
+        self._notify_data()
 
-    def _get_ordered_data(self, data_name=None, timeout=10, no_dbg_pause=True):
+    def _get_ordered_data(self, data_name=None, timeout=10, no_dbg_pause=True, max_count=0):
         """
         获取订阅的数据
 
-        :param data_name: 要获取的数据名称
+        :param data_name: 要获取的数据名称，为None时获取所有订阅的数据
         :param timeout: 等待数据的超时时间，默认：10
+        :param max_count: 最多获取的条数，默认：0，即获取全部
         :return: 是否成功，数据
-                数据格式：{"data_name": data_name, "url": url, "data": data}
+                数据格式：{"data_name": data_name, "url": url, "method": method, "post_data": post_data, "data": data}
                         data_name: 数据名称
                         url: 请求的url
+                        method: 请求方法
+                        post_data: 请求提交的数据
                         data: 请求返回的数据
+                数据为CaptureRecord实例，post_data和data在首次访问时才解码，也可以通过get_json()获取解析后的json对象
         """
+        end_time = time.time() + timeout
         while True:
-            data_names = [data_name] if data_name else self._data_filters.keys()
-            datas = []
+            with self._data_cond:
+                data_seq = self._data_seq
+            datas = self._drain_ordered_data(data_name=data_name, max_count=max_count)
+            if len(datas) > 0:
+                print(f'获取到 {len(datas)} 条{data_name if data_name else ""}数据.')
+                return True, datas
+
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                print(f'获取{data_name if data_name else ""}数据超时！')
+                if not no_dbg_pause:
+                    dbg_pause()
+                return False, datas
+
             with self._lock:
-                for name in data_names:
-                    if name in self._data_filters and len(self._data_filters[name].datas) > 0:
-                        datas += self._data_filters[name].datas
-                        if self._data_filters[name].once_only:
-                            del self._data_filters[name]
-                        else:
-                            self._data_filters[name].datas.clear()
-
-                if len(datas) > 0:
-                    print(f'获取到 {len(datas)} 条{data_name if data_name else ""}数据.')
-                    return True, datas
-                else:
-                    self._data_event.clear()
-                    ret = self._data_event.wait(timeout)
-                    if not ret:
-                        print(f'获取{data_name if data_name else ""}数据超时！')
-                        if not no_dbg_pause:
-                            dbg_pause()
-                        return False, datas
+                f = self._data_filters.get(data_name) if data_name else None
+            if f is not None:
+                # 仅等待指定过滤器的数据
+                f.wait(remaining)
+            else:
+                with self._data_cond:
+                    self._data_cond.wait_for(lambda: self._data_seq != data_seq, remaining)
+
+    def _drain_ordered_data(self, data_name=None, max_count=0):
+        """
+        取出已收到的订阅数据，不等待
+
+        :param data_name: 要获取的数据名称，为None时获取所有订阅的数据
+        :param max_count: 最多获取的条数，默认：0，即获取全部
+        :return: 数据数组
+        """
+        datas = []
+        with self._lock:
+            names = [data_name] if data_name else list(self._data_filters.keys())
+            for name in names:
+                if name not in self._data_filters:
+                    continue
+                f = self._data_filters[name]
+                items = f.get_many(max_count=max_count - len(datas) if max_count > 0 else 0)
+                datas += items
+                # 仅订阅一次的过滤器，数据取完后取消订阅
+                if f.once_only and len(items) > 0 and f.data_count == 0:
+                    del self._data_filters[name]
+                    f.close()
+                    self._update_filter_matcher()
+                if 0 < max_count <= len(datas):
+                    break
+        return datas
+
+    def _notify_data(self):
+        with self._data_cond:
+            self._data_seq += 1
+            self._data_cond.notify_all()
 
     def _start_mitmproxy(self, port=8089, debug=False):
-        self._mitmproxy_svr = MitmDumpThread("mitmdump", port=port, debug=debug)
+        # 返回mitmproxy是否已开始监听，未能监听时停止mitmproxy
+        if self._mitmproxy_workers > 0:
+            if self._selective_intercept and self._intercept_hosts is None:
+                # 工作进程启动后不能再修改要解密的主机，无法随订阅的过滤器变化
+                print('多进程方式运行mitmproxy时，selective_intercept需要通过intercept_hosts指定主机，将解密全部连接！')
+            self._mitmproxy_svr = MitmWorkerPool("mitmdump workers", port=port, workers=self._mitmproxy_workers,
+                                                 replay_path=self._replay_path,
+                                                 allow_hosts=self._get_allow_hosts() if self._intercept_hosts else None)
+        else:
+            self._mitmproxy_svr = MitmDumpThread("mitmdump", port=port, debug=debug, replay_path=self._replay_path,
+                                                 allow_hosts=self._get_allow_hosts())
         self._mitmproxy_svr.start()
+        if not self._mitmproxy_svr.wait_ready(timeout=10):
+            self._mitmproxy_svr.stop()
+            return False
+        return True
 
     def _stop_mitmproxy(self):
         self._mitmproxy_svr.stop()
@@ -424,24 +560,64 @@ class AirtestBot:
         ip = get_host(self._device_id) if not self._intercept_all else ""
         if self._on_response_func is None:
             self._on_response_func = self._on_response
-            self._interceptor_id = InterceptorMgr.register_interceptor(self._on_request_func, self._on_response_func,
-                                                                       ip=ip, intercept_all=self._intercept_all)
-        else:
-            self._interceptor_id = InterceptorMgr.register_interceptor(self._on_request_func, self._on_response_func,
-                                                                       ip=ip, intercept_all=self._intercept_all)
+        self._interceptor_id = InterceptorMgr.register_interceptor(self._on_request_func, self._on_response_func,
+                                                                   ip=ip, intercept_all=self._intercept_all,
+                                                                   async_dispatch=self._async_intercept)
 
     def _unregister_interceptor(self):
         InterceptorMgr.unregister_interceptor(self._interceptor_id)
 
+    def _update_filter_matcher(self):
+        # 过滤器变化后重建匹配器，匹配器本身不可变，截包线程可以不加锁直接使用
+        self._filter_matcher = FilterMatcher(self._data_filters.values())
+        allow_hosts = self._filter_matcher.allow_hosts
+        if allow_hosts is None:
+            self._subscribed_hosts = None
+        elif self._subscribed_hosts is not None:
+            # 要解密的主机只增不减：取消订阅后，已建立的（keep-alive、HTTP/2）连接仍可能被再次订阅时复用，
+            # 若改为透传，再次订阅时将收不到该主机的数据
+            self._subscribed_hosts += [h for h in allow_hosts if h not in self._subscribed_hosts]
+        if isinstance(self._mitmproxy_svr, MitmDumpThread):
+            self._mitmproxy_svr.set_allow_hosts(self._get_allow_hosts())
+
+    def _get_allow_hosts(self):
+        if not self._selective_intercept:
+            return None
+        if self._intercept_hosts is not None:
+            return get_host_regexes(self._intercept_hosts)
+        return list(self._subscribed_hosts) if self._subscribed_hosts is not None else None
+
     def _on_response(self, flow: http.HTTPFlow):
+        url = flow.request.url
+        f = self._filter_matcher.match(url)
+        if f is None:
+            return
+        flow_archive = self._flow_archive
+        if flow_archive is not None:
+            flow_archive.append(flow, data_name=f.data_name)
+        record = f.make_record(flow)
+        with self._lock:
+            # 匹配期间过滤器可能已被取消订阅或替换
+            cur = self._data_filters.get(f.data_name)
+            if cur is None or (cur is not f and cur.pattern.search(url) is None):
+                record.close()
+                return
+        if cur.extractor is not None:
+            # 提取在后台线程中进行（单线程，保持数据顺序），不阻塞截包线程
+            self._get_extract_executor().submit(self._put_data, cur, record)
+        else:
+            self._put_data(cur, record)
+
+    def _put_data(self, f, record):
+        # 在锁外加入数据：block策略下可能等待取数据的线程腾出空间；提取失败由f.extract记录，这里只处理加入数据时的异常
+        try:
+            f.put(f.extract(record))
+        except Exception as e:
+            logging.getLogger("airtest").error("过滤器[%s]加入数据失败：%r", f.data_name, e, exc_info=True)
+        self._notify_data()
+
+    def _get_extract_executor(self):
         with self._lock:
-            for data_name in self._data_filters.keys():
-                matches = re.search(self._data_filters[data_name].url_regex, flow.request.url, re.IGNORECASE)
-                if matches is not None:
-                    data = flow.response.get_text()
-                    self._data_filters[data_name].datas.append(
-                        {"data_name": data_name, "url": flow.request.url, "method": flow.request.method,
-                         "post_data": flow.request.get_text(), "data": data})
-                    # print(f"收到一条数据，当前数据条数：{len(self._data_filters[data_name].datas)}")
-                    self._data_event.set()
-                    return
+            if self._extract_executor is None:
+                self._extract_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='airtest extractor')
+            return self._extract_executor
@@ -0,0 +1,223 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 截包数据记录
+#
+
+import json
+import os
+import tempfile
+import threading
+
+
+class LazyBody:
+    """
+    延迟解码的请求/响应体，只保存原始（未解压）的数据，首次访问时才解码，超长的数据可以转存到临时文件。
+    创建时复制请求/响应对象，不引用流中的对象（拦截回调返回后mitmproxy可能修改或释放它们）
+    """
+
+    def __init__(self, message, max_body_size=0, spill_size=0, spill_dir=None):
+        """
+        :param message: mitmproxy的请求或响应对象
+        :param max_body_size: 最大数据长度（原始数据），超过则不保存数据，默认：0，即不限制
+        :param spill_size: 原始数据超过该长度时转存到临时文件，默认：0，即不转存
+        :param spill_dir: 临时文件目录，默认：None，即系统临时目录
+        """
+        self._message = None
+        self._file = None
+        self._text = None
+        self._decoded = False
+        self._lock = threading.Lock()
+        raw = message.raw_content if message is not None else None
+        self._size = len(raw) if raw else 0
+        self._too_large = 0 < max_body_size < self._size
+        if message is None or self._too_large:
+            self._decoded = True
+        else:
+            self._message = message.copy()
+            if 0 < spill_size < self._size:
+                with tempfile.NamedTemporaryFile(prefix='airtest_body_', dir=spill_dir, delete=False) as f:
+                    f.write(raw)
+                    self._file = f.name
+                self._message.raw_content = None
+
+    @property
+    def size(self):
+        """
+        原始数据长度
+        """
+        return self._size
+
+    @property
+    def too_large(self):
+        """
+        是否因超过最大长度而没有保存数据
+        """
+        return self._too_large
+
+    def get_text(self):
+        """
+        获取解码后的文本，首次调用时解码
+
+        :return: 文本，没有数据或数据超长时返回None
+        """
+        with self._lock:
+            if not self._decoded:
+                if self._file is not None:
+                    with open(self._file, 'rb') as f:
+                        self._message.raw_content = f.read()
+                    self._text = self._message.get_text()
+                    self.release()
+                else:
+                    self._text = self._message.get_text()
+                self._message = None
+                self._decoded = True
+            return self._text
+
+    def release(self):
+        """
+        删除转存的临时文件
+        """
+        if self._file is not None:
+            try:
+                os.remove(self._file)
+            except OSError:
+                pass
+            self._file = None
+
+    def close(self):
+        """
+        丢弃尚未解码的数据并删除转存的临时文件，之后get_text()返回None（已解码的文本不受影响）
+        """
+        with self._lock:
+            if not self._decoded:
+                self._message = None
+                self._decoded = True
+            self.release()
+
+    def __del__(self):
+        # 兜底：正常情况下应调用close()或由CaptureRecord.close()删除临时文件
+        self.release()
+
+
+class CaptureRecord(dict):
+    """
+    截包数据记录，字段与原有的数据格式相同：{"data_name": data_name, "url": url, "method": method,
+    "post_data": post_data, "data": data}，其中post_data和data在首次访问时才解码
+    """
+
+    def __init__(self, data_name, url, method, request=None, response=None, max_body_size=0, spill_size=0,
+                 spill_dir=None):
+        """
+        :param data_name: 数据名称
+        :param url: 请求的url
+        :param method: 请求方法
+        :param request: mitmproxy的请求对象
+        :param response: mitmproxy的响应对象
+        :param max_body_size: 最大数据长度（原始数据），超过则不保存数据，默认：0，即不限制
+        :param spill_size: 原始数据超过该长度时转存到临时文件，默认：0，即不转存
+        :param spill_dir: 临时文件目录，默认：None，即系统临时目录
+        """
+        super(CaptureRecord, self).__init__(data_name=data_name, url=url, method=method)
+        self._bodies = {
+            'post_data': LazyBody(request, max_body_size=max_body_size, spill_size=spill_size, spill_dir=spill_dir),
+            'data': LazyBody(response, max_body_size=max_body_size, spill_size=spill_size, spill_dir=spill_dir)
+        }
+        self._json = None
+
+    @property
+    def data_size(self):
+        """
+        响应数据的原始长度
+        """
+        return self._bodies['data'].size if 'data' in self._bodies else len(self.get('data') or '')
+
+    @property
+    def too_large(self):
+        """
+        响应数据是否因超过最大长度而没有保存
+        """
+        return self._bodies['data'].too_large if 'data' in self._bodies else False
+
+    def get_json(self):
+        """
+        将响应数据解析为json对象，只解析一次
+
+        :return: json对象
+        """
+        if self._json is None:
+            self._json = json.loads(self['data'])
+        return self._json
+
+    def close(self):
+        """
+        删除转存的临时文件，尚未读取的post_data、data之后为None。丢弃记录前应调用，也可以用with语句
+            >>> with record:
+            >>>     data = record['data']
+        """
+        for body in self._bodies.values():
+            body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _resolve(self, key):
+        body = self._bodies.pop(key, None)
+        if body is not None:
+            dict.__setitem__(self, key, body.get_text())
+
+    def _resolve_all(self):
+        for key in list(self._bodies.keys()):
+            self._resolve(key)
+
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._resolve(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self._bodies.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._bodies.pop(key, None) is None:
+            dict.__delitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._bodies or dict.__contains__(self, key)
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._bodies)
+
+    def __iter__(self):
+        self._resolve_all()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._resolve_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+
+    def copy(self):
+        self._resolve_all()
+        return dict(self)
+
+    def __repr__(self):
+        self._resolve_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        self._resolve_all()
+        return dict, (dict(self),)
@@ -0,0 +1,116 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 屏幕截图线程
+#
+
+import threading
+import time
+from collections import deque
+from airtest.core.settings import Settings as ST
+from airtest.core.helper import G
+
+
+class ScreenCaptureThread(threading.Thread):
+    """
+    后台截屏线程，持续从设备（MINICAP流）拉取屏幕帧，保存在一个带时间戳的环形缓冲区中
+    """
+
+    def __init__(self, device, name='screen capture thread', buffer_size=3, interval=0.05, quality=None,
+                 max_frame_age=1.0, max_backoff=2.0):
+        """
+        :param device: 设备对象
+        :param name: 线程名称
+        :param buffer_size: 环形缓冲区保存的帧数，默认：3
+        :param interval: 两次截屏之间的最小间隔，单位秒，默认：0.05
+        :param quality: 截图质量，默认：None，即使用ST.SNAPSHOT_QUALITY
+        :param max_frame_age: 最新一帧的帧龄超过该值时视为截屏已停滞（如设备连接异常），is_stale返回True，单位秒，默认：1.0
+        :param max_backoff: 截屏连续失败时，重试间隔按倍数增长的上限，单位秒，默认：2.0
+        """
+        super(ScreenCaptureThread, self).__init__(name=name, daemon=True)
+        self._device = device
+        self._interval = interval
+        self._quality = quality
+        self._max_frame_age = max_frame_age
+        self._max_backoff = max_backoff
+        self._frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    @property
+    def device(self):
+        return self._device
+
+    @property
+    def frame_age(self):
+        """
+        最新一帧的帧龄，单位秒，没有帧时返回None
+        """
+        with self._cond:
+            return time.time() - self._frames[-1][0] if len(self._frames) > 0 else None
+
+    @property
+    def is_stale(self):
+        """
+        截屏是否已停滞：还没有帧，或最新一帧的帧龄超过max_frame_age。停滞时应直接从设备截屏
+        """
+        age = self.frame_age
+        return age is None or age > self._max_frame_age
+
+    def run(self):
+        backoff = self._interval
+        failing = False
+        while not self._stop_event.is_set():
+            # 以开始截屏的时刻作为帧的时间戳，保证该帧一定晚于此前的操作
+            timestamp = time.time()
+            try:
+                screen = self._device.snapshot(filename=None, quality=self._quality or ST.SNAPSHOT_QUALITY)
+            except Exception as e:
+                # 连续失败时只记录一次，并逐步加大重试间隔
+                if not failing:
+                    G.LOGGING.warning("Background screen capture failed: %s", e)
+                    failing = True
+                backoff = min(backoff * 2, self._max_backoff)
+                self._stop_event.wait(backoff)
+                continue
+            if failing:
+                G.LOGGING.warning("Background screen capture recovered")
+                failing = False
+                backoff = self._interval
+            if screen is not None:
+                with self._cond:
+                    self._frames.append((timestamp, screen))
+                    self._cond.notify_all()
+            self._stop_event.wait(max(self._interval - (time.time() - timestamp), 0))
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_frame(self, newer_than=None, timeout=3):
+        """
+        获取最新的一帧
+
+        :param newer_than: 要求帧的时间戳晚于该时刻（time.time()），默认：None，即不要求
+        :param timeout: 等待满足要求的帧的超时时间，单位秒，默认：3
+        :return: (时间戳, 屏幕截图)，超时则返回 (None, None)
+        """
+        end_time = time.time() + timeout
+        with self._cond:
+            while not self._stop_event.is_set():
+                if len(self._frames) > 0 and (newer_than is None or self._frames[-1][0] > newer_than):
+                    return self._frames[-1]
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return None, None
+
+    def get_frames(self):
+        """
+        获取缓冲区中的所有帧
+
+        :return: [(时间戳, 屏幕截图)]，按时间从早到晚排列
+        """
+        with self._cond:
+            return list(self._frames)
@@ -0,0 +1,411 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 截包数据过滤器
+#
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import deque
+from airtest_ext.capture_record import CaptureRecord
+from airtest_ext.extractor import Extractor
+
+
+class Filter:
+    """
+    定义截包数据过滤规则
+    """
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    BLOCK = 'block'
+    SPILL = 'spill'
+
+    def __init__(self, data_name, url_regex, once_only=True, max_body_size=0, spill_size=0, spill_dir=None,
+                 max_count=0, overflow_policy=DROP_OLDEST, block_timeout=0.5, extractor=None):
+        """
+        :param data_name: 数据名称
+        :param url_regex: url正则
+        :param once_only: 是否是仅订阅（过滤）一次
+        :param max_body_size: 请求/响应体的最大长度（原始数据），超过则不保存，默认：0，即不限制
+        :param spill_size: 请求/响应体（原始数据）超过该长度时转存到临时文件，默认：0，即不转存
+        :param spill_dir: 转存的临时文件目录，默认：None，即系统临时目录
+        :param max_count: 内存中最多保存的数据条数，默认：0，即不限制
+        :param overflow_policy: 数据条数达到max_count时的处理策略：drop_oldest（丢弃最早的数据）、
+                                drop_newest（丢弃新数据）、block（阻塞截包线程，最长block_timeout秒，超时后丢弃新数据）、
+                                spill（新数据转存到临时文件，取数据时按顺序读回，读回的数据为普通dict），默认：drop_oldest
+        :param block_timeout: block策略下的最长阻塞时间，单位秒，默认：0.5
+        :param extractor: 数据提取器，Extractor实例或字段定义（字段名 -> JSONPath表达式），设置后响应数据在后台线程中
+                          解析一次并提取为数据行，订阅得到的数据为 {"data_name": data_name, "url": url,
+                          "method": method, "rows": 数据行数组, "error": 提取失败的原因，成功时为None}，
+                          默认：None，即不提取
+        """
+        self._data_name = data_name
+        self._url_regex = url_regex
+        self._once_only = once_only
+        self._max_body_size = max_body_size
+        self._spill_size = spill_size
+        self._spill_dir = spill_dir
+        self._max_count = max_count
+        self._overflow_policy = overflow_policy
+        self._block_timeout = block_timeout
+        self._extractor = Extractor(extractor) if isinstance(extractor, dict) else extractor
+        self._datas = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pattern = None
+        self._dropped_count = 0
+        self._extract_error_count = 0
+        self._last_extract_error = None
+        # 转存的数据：临时文件，读取位置，条数
+        self._spill_file = None
+        self._spill_pos = 0
+        self._spilled_count = 0
+
+    @property
+    def data_name(self):
+        return self._data_name
+
+    @property
+    def url_regex(self):
+        return self._url_regex
+
+    @property
+    def pattern(self):
+        """
+        预编译的url正则（忽略大小写）
+        """
+        if self._pattern is None:
+            self._pattern = re.compile(self._url_regex, re.IGNORECASE)
+        return self._pattern
+
+    @property
+    def once_only(self):
+        return self._once_only
+
+    @property
+    def hosts(self):
+        """
+        从url正则中解析出的主机名数组，正则含有顶层的 | 时逐个分支解析；
+        有分支不是以 http(s):// + 主机名 开头时返回None（无法确定要解密的主机）。
+        解密时按完整的主机名匹配（见get_host_regexes），主机名后没有 / 或端口的正则（如 https://api\\.foo\\.com）
+        虽然也能匹配 api.foo.com.evil.net 的url，但这些主机不会被解密
+        """
+        hosts = []
+        for branch in _split_top_level_branches(self._url_regex):
+            matches = re.match(r'\^?https?\??://((?:[\w-]|\\?\.)+)(?::\d+)?(?:/|\\/|\$|$)', branch, re.IGNORECASE)
+            if matches is None:
+                return None
+            host = matches.group(1).replace('\\.', '.').lower()
+            if host not in hosts:
+                hosts.append(host)
+        return hosts
+
+    @property
+    def datas(self):
+        """
+        当前保存的全部数据（含转存到临时文件的数据），按加入顺序排列。
+        注意：返回的是快照副本，不再是内部数组本身，修改或清空返回的数组不会影响过滤器中的数据；
+        取出数据用get_many()/drain()，替换全部数据用赋值（如 f.datas = []）
+        """
+        with self._cond:
+            datas = list(self._datas)
+            if self._spilled_count > 0:
+                self._spill_file.seek(self._spill_pos)
+                datas += [pickle.load(self._spill_file) for _ in range(self._spilled_count)]
+            return datas
+
+    @datas.setter  # 实现一个age相关的setter方法
+    def datas(self, datas):
+        with self._cond:
+            kept = set(id(data) for data in datas)
+            for data in self._datas:
+                if id(data) not in kept:
+                    _close_data(data)
+            self._datas = deque(datas)
+            self._spill_pos = 0
+            self._spilled_count = 0
+            if self._spill_file is not None:
+                self._spill_file.seek(0)
+                self._spill_file.truncate()
+            if len(self._datas) > 0:
+                self._cond.notify_all()
+
+    def make_record(self, flow):
+        """
+        根据截获的流生成数据记录，请求/响应体保留原始数据，首次访问时才解码
+
+        :param flow: mitmproxy的流
+        :return: CaptureRecord实例
+        """
+        return CaptureRecord(self._data_name, flow.request.url, flow.request.method, request=flow.request,
+                             response=flow.response, max_body_size=self._max_body_size,
+                             spill_size=self._spill_size, spill_dir=self._spill_dir)
+
+    @property
+    def extractor(self):
+        return self._extractor
+
+    def extract(self, record):
+        """
+        用提取器从数据记录中提取数据行。提取失败时记录日志及失败次数，数据行为空数组，error为失败原因
+
+        :param record: make_record生成的数据记录
+        :return: 提取后的数据，没有设置提取器时返回原数据记录
+        """
+        if self._extractor is None:
+            return record
+        error = None
+        try:
+            rows = self._extractor.extract(record.get_json())
+        except Exception as e:
+            self._extract_error_count += 1
+            self._last_extract_error = e
+            logging.getLogger("airtest").error("过滤器[%s]提取数据失败（%s）：%r", self._data_name, record['url'], e,
+                                               exc_info=True)
+            rows = []
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            record.close()
+        return {"data_name": record['data_name'], "url": record['url'], "method": record['method'], "rows": rows,
+                "error": error}
+
+    @property
+    def extract_error_count(self):
+        """
+        提取数据失败的次数
+        """
+        return self._extract_error_count
+
+    @property
+    def last_extract_error(self):
+        """
+        最近一次提取数据失败的异常，没有失败时为None
+        """
+        return self._last_extract_error
+
+    @property
+    def data_count(self):
+        with self._cond:
+            return self._count()
+
+    @property
+    def dropped_count(self):
+        """
+        因超过max_count而丢弃的数据条数
+        """
+        return self._dropped_count
+
+    @property
+    def spilled_count(self):
+        """
+        当前转存在临时文件中的数据条数
+        """
+        return self._spilled_count
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, data):
+        """
+        加入一条数据，并唤醒等待该过滤器数据的线程。数据条数达到max_count时按overflow_policy处理
+
+        :param data: 数据
+        :return: 无
+        """
+        with self._cond:
+            if self._max_count > 0:
+                if self._overflow_policy == Filter.BLOCK:
+                    self._cond.wait_for(lambda: len(self._datas) < self._max_count or self._closed,
+                                        self._block_timeout)
+                if self._overflow_policy == Filter.SPILL:
+                    # 已有转存的数据时，新数据也要转存，以保持顺序
+                    if self._spilled_count > 0 or len(self._datas) >= self._max_count:
+                        self._spill(data)
+                        self._cond.notify_all()
+                        return
+                elif len(self._datas) >= self._max_count:
+                    self._dropped_count += 1
+                    if self._overflow_policy != Filter.DROP_OLDEST:
+                        _close_data(data)
+                        return
+                    _close_data(self._datas.popleft())
+            self._datas.append(data)
+            self._cond.notify_all()
+
+    def get_many(self, max_count=0, timeout=None):
+        """
+        取出数据，没有数据时等待直到有数据、过滤器关闭或超时为止
+
+        :param max_count: 最多取出的条数，默认：0，即取出全部
+        :param timeout: 等待超时时间，默认：None，即不等待
+        :return: 数据数组，没有数据时为空数组
+        """
+        with self._cond:
+            if timeout is not None and self._count() == 0:
+                self._cond.wait_for(lambda: self._count() > 0 or self._closed, timeout)
+            count = self._count() if max_count <= 0 else min(max_count, self._count())
+            datas = [self._datas.popleft() for _ in range(min(count, len(self._datas)))]
+            if len(datas) < count:
+                datas += self._unspill(count - len(datas))
+            if len(datas) > 0:
+                # 唤醒block策略下等待空间的截包线程
+                self._cond.notify_all()
+            return datas
+
+    def drain(self):
+        """
+        取出全部数据，不等待
+
+        :return: 数据数组
+        """
+        return self.get_many()
+
+    def wait(self, timeout=None):
+        """
+        等待数据，直到有数据、过滤器关闭或超时为止
+
+        :param timeout: 等待超时时间，默认：None，即一直等待
+        :return: 是否有数据
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._count() > 0 or self._closed, timeout)
+            return self._count() > 0
+
+    def close(self):
+        """
+        关闭过滤器（取消订阅或被同名过滤器替换时），唤醒所有等待的线程
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _count(self):
+        return len(self._datas) + self._spilled_count
+
+    def _spill(self, data):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='airtest_filter_', dir=self._spill_dir)
+        self._spill_file.seek(0, os.SEEK_END)
+        pickle.dump(data, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled_count += 1
+
+    def _unspill(self, count):
+        self._spill_file.seek(self._spill_pos)
+        datas = [pickle.load(self._spill_file) for _ in range(count)]
+        self._spilled_count -= count
+        if self._spilled_count == 0:
+            # 转存的数据已全部读回，清空临时文件
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_pos = 0
+        else:
+            self._spill_pos = self._spill_file.tell()
+        return datas
+
+
+def _split_top_level_branches(regex):
+    # 按顶层（不在分组、字符集中，未转义）的 | 拆分正则
+    branches = []
+    start = 0
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\':
+            i += 1
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+            if regex.startswith('^]', i + 1) or regex.startswith(']', i + 1):
+                # 字符集开头的 ] 是普通字符
+                i = regex.index(']', i + 1)
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            branches.append(regex[start:i])
+            start = i + 1
+        i += 1
+    branches.append(regex[start:])
+    return branches
+
+
+def _close_data(data):
+    # 丢弃数据记录时删除其转存的临时文件
+    if isinstance(data, CaptureRecord):
+        data.close()
+
+
+class FilterMatcher:
+    """
+    过滤器匹配器，将多个过滤器的url正则合并为一个正则，一次匹配即可确定url所属的过滤器。
+    按过滤器顺序优先匹配，与逐个过滤器匹配的结果一致；正则中含有反向引用等无法合并的情况时，退化为逐个匹配
+    """
+
+    def __init__(self, filters):
+        """
+        :param filters: 过滤器数组
+        """
+        self._filters = list(filters)
+        self._group_filters = {}
+        self._combined = None
+        if len(self._filters) > 1 and not any(re.search(r'\\[1-9]|\(\?P=', f.url_regex) for f in self._filters):
+            parts = []
+            for i, f in enumerate(self._filters):
+                group_name = f'_filter_{i}'
+                self._group_filters[group_name] = f
+                # 用[\s\S]*?前缀模拟search，不改变过滤器正则中 . 的含义，标志与Filter.pattern相同
+                parts.append(f'(?P<{group_name}>[\\s\\S]*?(?:{f.url_regex}))')
+            try:
+                self._combined = re.compile('|'.join(parts), re.IGNORECASE)
+            except re.error:
+                self._combined = None
+        if self._combined is None:
+            for f in self._filters:
+                f.pattern
+        hosts = [f.hosts for f in self._filters]
+        self._allow_hosts = None if None in hosts else get_host_regexes([h for f_hosts in hosts for h in f_hosts])
+
+    @property
+    def allow_hosts(self):
+        """
+        所有过滤器对应的主机名正则数组（mitmproxy的allow_hosts格式），有过滤器无法解析出主机名时为None
+        """
+        return self._allow_hosts
+
+    def match(self, url):
+        """
+        查找与url匹配的第一个过滤器
+
+        :param url: 请求的url
+        :return: 匹配的过滤器，没有匹配时返回None
+        """
+        if self._combined is not None:
+            matches = self._combined.match(url)
+            return self._group_filters[matches.lastgroup] if matches is not None else None
+        for f in self._filters:
+            if f.pattern.search(url) is not None:
+                return f
+        return None
+
+
+def get_host_regexes(hosts):
+    """
+    将主机名转换为mitmproxy的allow_hosts/ignore_hosts格式的正则，正则按完整的主机名（可带端口）匹配，
+    不匹配以该主机名开头的其他主机（如 api.foo.com.evil.net）
+
+    :param hosts: 主机名数组
+    :return: 正则数组，已去重
+    """
+    regexes = []
+    for host in hosts:
+        regex = rf'^{re.escape(host)}(?::\d+)?$'
+        if regex not in regexes:
+            regexes.append(regex)
+    return regexes
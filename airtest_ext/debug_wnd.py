@@ -1,6 +1,7 @@
 #! /usr/bin/python
 # -*-coding: UTF-8 -*-
 import cv2
+import inspect
 import dearpygui.dearpygui as dpg
 import dearpygui.demo as demo
 import os
@@ -458,7 +459,7 @@ class DebugWindow(DpgApp):
 
     def _show_screen(self, screen=None):
         if screen is None:
-            screen = G.DEVICE.snapshot(filename=None, quality=ST.SNAPSHOT_QUALITY)
+            screen = get_screen()
         self._screen_img = screen
         self._load_texture(screen, is_source=True)
         self._draw_image(is_source=True)
@@ -519,7 +520,7 @@ class DebugWindow(DpgApp):
         self._draw_matched_rect(None)
 
     def _get_stack_info(self, stack_frames=None):
-        frames = inspect.stack() if stack_frames is None else stack_frames
+        frames = DebugStack() if stack_frames is None else stack_frames
         for f in frames:
             if self._user_module.__file__ == inspect.getmodule(f[0]).__file__:
                 frame = f
@@ -537,8 +538,7 @@ class DebugWindow(DpgApp):
     def _get_debug_info(match_info):
         infos = []
         results = match_info['results']
-        feature = match_info['feature']
-        infos.append(f'信度阈值: {feature.threshold}')
+        infos.append(f'信度阈值: {match_info["threshold"]}')
         infos.append(f'匹配结果: {"匹配失败" if results is None else "匹配成功"}')
         if results is not None:
             infos.append(f'结果数量: {len(results)}')
@@ -618,13 +618,12 @@ class DebugWindow(DpgApp):
             user_data = {}
             for i in range(len(debug_infos)):
                 results = debug_infos[i]["results"]
-                feature = debug_infos[i]['feature']
                 if results is None:
-                    key = f'{i + 1}  匹配失败  t-{feature.threshold}'
+                    key = f'{i + 1}  匹配失败  t-{debug_infos[i]["threshold"]}'
                 elif len(results) == 1:
-                    key = f'{i + 1}  匹配成功  f-{results[0]["confidence"]:.2f}  t-{feature.threshold})'
+                    key = f'{i + 1}  匹配成功  f-{results[0]["confidence"]:.2f}  t-{debug_infos[i]["threshold"]})'
                 else:
-                    key = f'{i + 1}  匹配成功  c-{len(results)}  t-{feature.threshold})'
+                    key = f'{i + 1}  匹配成功  c-{len(results)}  t-{debug_infos[i]["threshold"]})'
                 items.append(key)
                 user_data[key] = debug_infos[i]
             if len(items) > 0:
@@ -0,0 +1,120 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 截包数据提取：用预编译的JSONPath从响应数据中提取字段
+#
+
+import json
+import re
+from jsonpath import jsonpath
+
+
+class JsonPath:
+    """
+    预编译的JSONPath。只含 .key、['key']、[n]（n为非负整数）、[*]、.* 的简单路径在创建时解析为步骤数组，直接按步骤取值；
+    其余表达式（如 ..key、负数下标、过滤表达式等）交给jsonpath库处理，两种方式的结果一致
+    """
+    _token = re.compile(r"\.(\w+)|\['([^']*)'\]|\[(\d+)\]|(\[\*\]|\.\*)")
+
+    def __init__(self, expr):
+        """
+        :param expr: JSONPath表达式，可以省略开头的 $.
+        """
+        if not expr.startswith('$'):
+            expr = '$.' + expr
+        self._expr = expr
+        self._steps = self._compile(expr[1:])
+        # 含通配符的路径返回数组，否则返回单个值
+        self._multiple = self._steps is None and any(s in expr for s in ('*', '..', '?(', ':')) or \
+            self._steps is not None and any(step is None for step in self._steps)
+
+    @property
+    def expr(self):
+        return self._expr
+
+    def find(self, obj):
+        """
+        查找所有匹配的值
+
+        :param obj: json对象
+        :return: 匹配的值数组
+        """
+        if self._steps is None:
+            result = jsonpath(obj, self._expr)
+            return result if result else []
+        nodes = [obj]
+        for step in self._steps:
+            next_nodes = []
+            for node in nodes:
+                if step is None:
+                    if isinstance(node, dict):
+                        next_nodes += node.values()
+                    elif isinstance(node, list):
+                        next_nodes += node
+                elif isinstance(step, int):
+                    if isinstance(node, list) and step < len(node):
+                        next_nodes.append(node[step])
+                elif isinstance(node, dict) and step in node:
+                    next_nodes.append(node[step])
+            nodes = next_nodes
+        return nodes
+
+    def extract(self, obj, default=None):
+        """
+        提取值，含通配符的路径返回匹配的值数组，否则返回第一个匹配的值
+
+        :param obj: json对象
+        :param default: 没有匹配时的返回值，默认：None
+        :return: 提取的值
+        """
+        values = self.find(obj)
+        if self._multiple:
+            return values
+        return values[0] if len(values) > 0 else default
+
+    @staticmethod
+    def _compile(path):
+        steps = []
+        pos = 0
+        while pos < len(path):
+            matches = JsonPath._token.match(path, pos)
+            if matches is None:
+                return None
+            key, quoted_key, index, wildcard = matches.groups()
+            if wildcard is not None:
+                steps.append(None)
+            elif index is not None:
+                steps.append(int(index))
+            else:
+                steps.append(key if key is not None else quoted_key)
+            pos = matches.end()
+        return steps
+
+
+class Extractor:
+    """
+    声明式的数据提取器：先用rows路径从响应json中选出数据行（不设置时整个json为一行），再按fields从每行中提取字段
+    """
+
+    def __init__(self, fields, rows=None):
+        """
+        :param fields: 字段定义，字段名 -> JSONPath表达式（相对于数据行）、JsonPath实例或函数（参数为数据行）
+        :param rows: 选出数据行的JSONPath表达式，默认：None，即整个json为一行
+            >>> # 每条笔记提取为一行
+            >>> Extractor({"id": "id", "title": "display_title", "likes": "$.interact_info.liked_count"},
+            >>>           rows="$.data.items[*].note_card")
+        """
+        self._fields = {name: JsonPath(path) if isinstance(path, str) else path for name, path in fields.items()}
+        self._rows = JsonPath(rows) if isinstance(rows, str) else rows
+
+    def extract(self, obj):
+        """
+        提取数据行
+
+        :param obj: json对象或json字符串
+        :return: 数据行数组，每行为 字段名 -> 值 的dict
+        """
+        if isinstance(obj, (str, bytes)):
+            obj = json.loads(obj)
+        rows = self._rows.find(obj) if self._rows is not None else [obj]
+        return [{name: field.extract(row) if isinstance(field, JsonPath) else field(row)
+                 for name, field in self._fields.items()} for row in rows]
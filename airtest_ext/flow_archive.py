@@ -0,0 +1,304 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 截包数据归档：将截获的流追加保存到磁盘文件，并建立索引
+#
+
+import hashlib
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from mitmproxy import http
+from airtest_ext.capture_record import CaptureRecord
+
+
+class FlowArchive:
+    """
+    截包数据归档。数据文件由连续的记录组成，每条记录为：4字节长度 + 头部信息（json） + 4字节长度 + 压缩后的请求体
+    + 4字节长度 + 压缩后的响应体，请求/响应体保存原始（未解码）的数据。
+    索引文件（数据文件名 + .idx）每行一条json，记录数据名称、url、host、客户端IP、时间戳、请求体哈希、响应耗时以及记录在数据文件中的位置，
+    查询时只需读取索引文件，再按位置读取需要的记录。
+    追加时只在截包线程中取出流的数据，压缩及写文件在后台的写线程中进行
+    """
+    _length = struct.Struct('>I')
+
+    def __init__(self, path, compress_level=1, max_pending=1000):
+        """
+        :param path: 数据文件路径，文件已存在时追加
+        :param compress_level: 请求/响应体的zlib压缩级别，默认：1
+        :param max_pending: 等待写线程写入的最大记录数，超过时追加操作等待写线程，默认：1000
+        """
+        self._path = path
+        self._index_path = path + '.idx'
+        self._compress_level = compress_level
+        self._lock = threading.Lock()
+        self._data_file = None
+        self._index_file = None
+        self._reader = None
+        self._index = None
+        # (请求方法, url) -> 索引项数组
+        self._url_index = None
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._writer = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def append(self, flow: http.HTTPFlow, data_name=''):
+        """
+        追加一条流，由写线程异步写入文件
+
+        :param flow: mitmproxy的流
+        :param data_name: 数据名称（匹配到的过滤器名称）
+        :return: 无
+        """
+        request, response = flow.request, flow.response
+        # 只取出写入需要的数据（均为不可变对象），之后流被修改不影响写入的内容
+        item = {
+            'data_name': data_name,
+            'method': request.method,
+            'url': request.url,
+            'host': request.pretty_host,
+            'ip': flow.client_conn.peername[0] if flow.client_conn.peername else '',
+            'timestamp': request.timestamp_start or time.time(),
+            'elapsed': self._get_elapsed(request, response),
+            'request_headers': request.headers.fields,
+            'request_http_version': request.http_version,
+            'request_body': request.raw_content or b'',
+            'status_code': response.status_code if response is not None else None,
+            'reason': response.reason if response is not None else '',
+            'response_http_version': response.http_version if response is not None else '',
+            'response_headers': response.headers.fields if response is not None else (),
+            'response_body': (response.raw_content or b'') if response is not None else b'',
+        }
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(name='flow archive writer', target=self._write_loop, daemon=True)
+                self._writer.start()
+        self._pending.put(item)
+
+    def flush(self):
+        """
+        等待已追加的流全部写入文件
+        """
+        if self._writer is not None:
+            self._pending.join()
+
+    def get_entries(self, method, url):
+        """
+        按请求方法及url查找记录
+
+        :param method: 请求方法
+        :param url: 请求的url
+        :return: 索引项数组，按记录顺序排列
+        """
+        self.get_index()
+        with self._lock:
+            return list(self._url_index.get((method, url), ()))
+
+    def find(self, data_name=None, url_regex=None, host=None, ip=None, start_time=None, end_time=None):
+        """
+        按条件查询索引，只读取索引文件
+
+        :param data_name: 数据名称，默认：None，即不限
+        :param url_regex: url正则，默认：None，即不限
+        :param host: 主机名，默认：None，即不限
+        :param ip: 客户端IP，默认：None，即不限
+        :param start_time: 开始时间（time.time()），默认：None，即不限
+        :param end_time: 结束时间（time.time()），默认：None，即不限
+        :return: 索引项数组，按记录顺序排列
+        """
+        pattern = re.compile(url_regex, re.IGNORECASE) if url_regex else None
+        entries = []
+        for entry in self.get_index():
+            if data_name is not None and entry['data_name'] != data_name:
+                continue
+            if host is not None and entry['host'] != host:
+                continue
+            if ip is not None and entry['ip'] != ip:
+                continue
+            if start_time is not None and entry['timestamp'] < start_time:
+                continue
+            if end_time is not None and entry['timestamp'] > end_time:
+                continue
+            if pattern is not None and pattern.search(entry['url']) is None:
+                continue
+            entries.append(entry)
+        return entries
+
+    def get_index(self):
+        """
+        获取全部索引项，首次调用时读取索引文件
+
+        :return: 索引项数组
+        """
+        self.flush()
+        with self._lock:
+            if self._index is None:
+                self._index = []
+                self._url_index = {}
+                if os.path.exists(self._index_path):
+                    with open(self._index_path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            line = line.strip()
+                            if line:
+                                try:
+                                    self._add_index(json.loads(line))
+                                except ValueError:
+                                    # 崩溃时最后一行可能不完整
+                                    pass
+            return list(self._index)
+
+    def read(self, entry):
+        """
+        读取一条记录，请求/响应的头部与录制时完全相同
+
+        :param entry: 索引项
+        :return: (请求, 响应)，为mitmproxy的请求/响应对象，没有响应时为None
+        """
+        self.flush()
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self._path, 'rb')
+            self._reader.seek(entry['offset'])
+            record = self._reader.read(entry['length'])
+        parts = []
+        pos = 0
+        for _ in range(3):
+            length = self._length.unpack_from(record, pos)[0]
+            pos += self._length.size
+            parts.append(record[pos:pos + length])
+            pos += length
+        header = json.loads(parts[0].decode('utf-8'))
+        # make()会按（空的）内容重新计算Content-Length等头部，设置原始数据后再恢复录制的头部
+        request = http.Request.make(header['method'], header['url'])
+        request.raw_content = zlib.decompress(parts[1])
+        request.headers = self._load_headers(header['request_headers'])
+        if header.get('request_http_version'):
+            request.http_version = header['request_http_version']
+        response = None
+        if header['status_code'] is not None:
+            response = http.Response.make(header['status_code'])
+            response.raw_content = zlib.decompress(parts[2])
+            response.headers = self._load_headers(header['response_headers'])
+            if header.get('response_http_version'):
+                response.http_version = header['response_http_version']
+            if 'reason' in header:
+                response.reason = header['reason']
+        return request, response
+
+    def read_record(self, entry):
+        """
+        读取一条记录，并转换为订阅数据的格式
+
+        :param entry: 索引项
+        :return: CaptureRecord实例，post_data和data在首次访问时才解码
+        """
+        request, response = self.read(entry)
+        return CaptureRecord(entry['data_name'], entry['url'], entry['method'], request=request, response=response)
+
+    def close(self):
+        writer = self._writer
+        if writer is not None:
+            # 写完已追加的流后退出
+            self._pending.put(None)
+            writer.join()
+            self._writer = None
+        with self._lock:
+            for f in (self._data_file, self._index_file, self._reader):
+                if f is not None:
+                    f.close()
+            self._data_file = None
+            self._index_file = None
+            self._reader = None
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    break
+                self._write(item)
+                if self._pending.empty():
+                    # 队列中的记录都写完后再刷新，进程崩溃时已写入的数据不丢失
+                    with self._lock:
+                        self._data_file.flush()
+                        self._index_file.flush()
+            except Exception as e:
+                print(e)
+            finally:
+                self._pending.task_done()
+
+    def _write(self, item):
+        header = {
+            'method': item['method'],
+            'url': item['url'],
+            'request_http_version': item['request_http_version'],
+            'request_headers': self._dump_headers(item['request_headers']),
+            'status_code': item['status_code'],
+            'reason': item['reason'],
+            'response_http_version': item['response_http_version'],
+            'response_headers': self._dump_headers(item['response_headers']),
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        req_bytes = zlib.compress(item['request_body'], self._compress_level)
+        resp_bytes = zlib.compress(item['response_body'], self._compress_level)
+        record = b''.join([self._length.pack(len(header_bytes)), header_bytes,
+                           self._length.pack(len(req_bytes)), req_bytes,
+                           self._length.pack(len(resp_bytes)), resp_bytes])
+        entry = {
+            'data_name': item['data_name'],
+            'method': item['method'],
+            'url': item['url'],
+            'host': item['host'],
+            'ip': item['ip'],
+            'timestamp': item['timestamp'],
+            'body_hash': self.get_body_hash(item['request_body']),
+            'elapsed': item['elapsed'],
+            'offset': 0,
+            'length': len(record),
+        }
+        with self._lock:
+            if self._data_file is None:
+                self._data_file = open(self._path, 'ab')
+                self._index_file = open(self._index_path, 'a', encoding='utf-8')
+            self._data_file.seek(0, os.SEEK_END)
+            entry['offset'] = self._data_file.tell()
+            self._data_file.write(record)
+            self._index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            if self._index is not None:
+                self._add_index(entry)
+
+    def _add_index(self, entry):
+        self._index.append(entry)
+        self._url_index.setdefault((entry['method'], entry['url']), []).append(entry)
+
+    @staticmethod
+    def get_body_hash(body):
+        """
+        计算请求体的哈希值
+
+        :param body: 请求体（原始数据）
+        :return: 哈希值（十六进制字符串）
+        """
+        return hashlib.sha1(body or b'').hexdigest()
+
+    @staticmethod
+    def _get_elapsed(request, response):
+        # 从开始发送请求到收到完整响应的时间
+        if response is None or not request.timestamp_start or not response.timestamp_end:
+            return 0
+        return max(response.timestamp_end - request.timestamp_start, 0)
+
+    @staticmethod
+    def _dump_headers(fields):
+        return [[k.decode('latin-1'), v.decode('latin-1')] for k, v in fields]
+
+    @staticmethod
+    def _load_headers(headers):
+        return http.Headers([(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers])
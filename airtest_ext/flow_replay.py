@@ -0,0 +1,115 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 截包数据回放：用归档的流应答请求，不访问真实的服务器
+#
+
+import asyncio
+import threading
+from mitmproxy import http
+from airtest_ext.flow_archive import FlowArchive
+
+
+class FlowReplayer:
+    """
+    回放器，按 请求方法 + url + 请求体哈希 在归档中查找记录，直接以记录的响应应答请求。
+    同一请求有多条记录时按录制顺序依次使用，用完后重复使用最后一条。
+    作为mitmproxy的addon添加时，按录制耗时延迟应答不会阻塞mitmproxy的事件循环；
+    也可以作为请求拦截器注册到InterceptorMgr，此时立即应答，不支持按录制耗时延迟
+    """
+
+    def __init__(self, archive, preserve_timing=False, speed=1.0, not_found_status=404):
+        """
+        :param archive: FlowArchive实例或归档文件路径
+        :param preserve_timing: 是否按录制时的响应耗时延迟应答，默认：False，仅作为addon时有效
+        :param speed: 回放速度倍数，preserve_timing为True时有效，默认：1.0
+        :param not_found_status: 归档中没有对应记录时应答的状态码，默认：404，为None时放行请求，访问真实的服务器
+        """
+        self._archive = archive if isinstance(archive, FlowArchive) else FlowArchive(archive)
+        self._preserve_timing = preserve_timing
+        self._speed = speed
+        self._not_found_status = not_found_status
+        self._lock = threading.Lock()
+        # (请求方法, url, 请求体哈希) -> 已使用的记录数
+        self._used_counts = {}
+        self._hit_count = 0
+        self._miss_count = 0
+
+    @property
+    def archive(self):
+        return self._archive
+
+    @property
+    def hit_count(self):
+        return self._hit_count
+
+    @property
+    def miss_count(self):
+        return self._miss_count
+
+    def __call__(self, flow: http.HTTPFlow):
+        # 作为请求拦截器时立即应答
+        if flow.response is None:
+            flow.response, _ = self._get_response(flow.request)
+
+    def request(self, flow: http.HTTPFlow):
+        """
+        mitmproxy的request事件，需要延迟应答时挂起该流，到时再放行，不阻塞事件循环
+
+        :param flow: mitmproxy的流
+        :return: mitmproxy 8及以上版本中需要延迟时返回协程，由mitmproxy等待
+        """
+        if flow.response is not None:
+            # 已被其他拦截器应答（如内部控制请求）
+            return None
+        response, delay = self._get_response(flow.request)
+        if delay <= 0:
+            flow.response = response
+            return None
+        reply = getattr(flow, 'reply', None)
+        if reply is not None and hasattr(reply, 'take'):
+            # mitmproxy 7：接管reply后，mitmproxy等到commit才继续处理该流
+            reply.take()
+            asyncio.get_event_loop().call_later(delay, self._respond, flow, response)
+            return None
+        return self._respond_later(flow, response, delay)
+
+    def close(self):
+        self._archive.close()
+
+    def _get_response(self, request):
+        """
+        查找请求对应的响应
+
+        :param request: mitmproxy的请求对象
+        :return: (响应, 延迟应答的时间)，没有记录且not_found_status为None时响应为None
+        """
+        body_hash = FlowArchive.get_body_hash(request.raw_content)
+        entries = [e for e in self._archive.get_entries(request.method, request.url) if e['body_hash'] == body_hash]
+        key = (request.method, request.url, body_hash)
+        with self._lock:
+            if len(entries) == 0:
+                self._miss_count += 1
+            else:
+                self._hit_count += 1
+                used_count = self._used_counts.get(key, 0)
+                self._used_counts[key] = used_count + 1
+        if len(entries) == 0:
+            if self._not_found_status is None:
+                return None, 0
+            return http.Response.make(self._not_found_status, b"not found in the replay archive",
+                                      {"Content-Type": "text/plain"}), 0
+
+        entry = entries[min(used_count, len(entries) - 1)]
+        _, response = self._archive.read(entry)
+        delay = entry.get('elapsed', 0) / self._speed if self._preserve_timing else 0
+        return response if response is not None else http.Response.make(502), delay
+
+    @staticmethod
+    def _respond(flow, response):
+        flow.response = response
+        flow.reply.commit()
+
+    @staticmethod
+    async def _respond_later(flow, response, delay):
+        await asyncio.sleep(delay)
+        flow.response = response
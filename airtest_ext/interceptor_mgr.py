@@ -4,74 +4,180 @@
 #
 
 from mitmproxy import http
+import queue
 import threading
 
 
+class AsyncInterceptor:
+    """
+    异步拦截器，将流的只读副本放入有界队列，由独立的工作线程调用拦截器，截包线程不等待拦截器执行完成。
+    注意：拦截器对副本的修改不会影响实际的请求/响应，需要修改请求/响应的拦截器请使用同步方式
+    """
+    DROP_NEWEST = 'drop_newest'
+    DROP_OLDEST = 'drop_oldest'
+    BLOCK = 'block'
+
+    def __init__(self, func, max_queue_size=1000, full_policy=DROP_OLDEST, block_timeout=1.0,
+                 name='async interceptor'):
+        """
+        :param func: 拦截器函数
+        :param max_queue_size: 队列的最大长度，默认：1000
+        :param full_policy: 队列满时的处理策略：drop_newest（丢弃新数据）、drop_oldest（丢弃最早的数据）、
+                            block（阻塞截包线程，最长block_timeout秒，超时后丢弃新数据），默认：drop_oldest
+        :param block_timeout: block策略下的最长阻塞时间，单位秒，默认：1.0
+        :param name: 工作线程名称
+        """
+        self._func = func
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._full_policy = full_policy
+        self._block_timeout = block_timeout
+        self._dropped_count = 0
+        self._thread = threading.Thread(name=name, target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped_count(self):
+        return self._dropped_count
+
+    def __call__(self, flow: http.HTTPFlow):
+        self._submit(flow.copy())
+
+    def stop(self):
+        # 处理完队列中已有的数据后退出
+        self._queue.put(None)
+        self._thread.join()
+
+    def _submit(self, flow):
+        try:
+            if self._full_policy == AsyncInterceptor.BLOCK:
+                self._queue.put(flow, timeout=self._block_timeout)
+            else:
+                self._queue.put_nowait(flow)
+        except queue.Full:
+            if self._full_policy == AsyncInterceptor.DROP_OLDEST:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(flow)
+                except queue.Full:
+                    pass
+            self._dropped_count += 1
+
+    def _run(self):
+        while True:
+            flow = self._queue.get()
+            if flow is None:
+                break
+            try:
+                self._func(flow)
+            except Exception as e:
+                print(e)
+
+
 class InterceptorMgr:
     _internal_url = "http://mitmproxy.mgr/"
+    # 仅在注册/注销时使用，截包时不加锁
     _lock = threading.RLock()
-    _id_to_ip_dict = {}
-    _ip_to_id_dict = {}
-    _request_interceptors = {}
-    _response_interceptors = {}
+    # 注册信息：interceptor_id -> (request_interceptor, response_interceptor, ip, intercept_all)
+    # 异步方式注册时，拦截器为AsyncInterceptor实例
+    _registrations = {}
+    # 分发表：(拦截所有IP的拦截器元组, {客户端IP: 该IP对应的全部拦截器元组})，注册变化时整体替换
+    _request_table = ((), {})
+    _response_table = ((), {})
     _reg_count = 0
-    
+
     def __init__(self):
         pass
 
     @staticmethod
-    def register_interceptor(request_interceptor, response_interceptor, ip="", intercept_all=False):
+    def register_interceptor(request_interceptor, response_interceptor, ip="", intercept_all=False,
+                             async_dispatch=False, max_queue_size=1000, full_policy=AsyncInterceptor.DROP_OLDEST):
+        """
+        注册拦截器
+
+        :param request_interceptor: 请求拦截器
+        :param response_interceptor: 响应拦截器
+        :param ip: 只拦截该客户端IP的请求，默认：""
+        :param intercept_all: 是否拦截所有IP的请求，默认：False
+        :param async_dispatch: 是否异步执行拦截器（拦截器收到的是只读副本），默认：False
+        :param max_queue_size: 异步执行时队列的最大长度，默认：1000
+        :param full_policy: 异步执行时队列满的处理策略，参见AsyncInterceptor，默认：drop_oldest
+        :return: 拦截器ID
+        """
         interceptor_id = None
         if request_interceptor is not None or response_interceptor is not None:
+            if async_dispatch:
+                if request_interceptor is not None:
+                    request_interceptor = AsyncInterceptor(request_interceptor, max_queue_size=max_queue_size,
+                                                           full_policy=full_policy,
+                                                           name='async request interceptor')
+                if response_interceptor is not None:
+                    response_interceptor = AsyncInterceptor(response_interceptor, max_queue_size=max_queue_size,
+                                                            full_policy=full_policy,
+                                                            name='async response interceptor')
             with InterceptorMgr._lock:
                 InterceptorMgr._reg_count += 1
                 interceptor_id = InterceptorMgr._reg_count
-                if request_interceptor:
-                    InterceptorMgr._request_interceptors[interceptor_id] = (request_interceptor, intercept_all)
-                if response_interceptor:
-                    InterceptorMgr._response_interceptors[interceptor_id] = (response_interceptor, intercept_all)
-                if ip is not None and ip != "":
-                    InterceptorMgr._id_to_ip_dict[interceptor_id] = ip
-                    InterceptorMgr._ip_to_id_dict[ip] = interceptor_id
+                InterceptorMgr._registrations[interceptor_id] = (request_interceptor, response_interceptor,
+                                                                 ip if ip else "", intercept_all)
+                InterceptorMgr._rebuild_tables()
         return interceptor_id
 
     @staticmethod
     def unregister_interceptor(interceptor_id):
         if interceptor_id is not None:
             with InterceptorMgr._lock:
-                if interceptor_id in InterceptorMgr._id_to_ip_dict:
-                    ip = InterceptorMgr._id_to_ip_dict[interceptor_id]
-                    del InterceptorMgr._ip_to_id_dict[ip]
-                    del InterceptorMgr._id_to_ip_dict[interceptor_id]
-                if interceptor_id in InterceptorMgr._request_interceptors:
-                    del InterceptorMgr._request_interceptors[interceptor_id]
-                if interceptor_id in InterceptorMgr._response_interceptors:
-                    del InterceptorMgr._response_interceptors[interceptor_id]
+                registration = InterceptorMgr._registrations.pop(interceptor_id, None)
+                if registration is not None:
+                    InterceptorMgr._rebuild_tables()
+            if registration is not None:
+                for func in registration[:2]:
+                    if isinstance(func, AsyncInterceptor):
+                        func.stop()
 
     @staticmethod
     def request(flow: http.HTTPFlow):
         if flow.request.url.startswith(InterceptorMgr._internal_url):
             InterceptorMgr._cancel_request(flow)
         else:
-            InterceptorMgr._intercept_core(InterceptorMgr._request_interceptors, flow)
+            InterceptorMgr._intercept_core(InterceptorMgr._request_table, flow)
 
     @staticmethod
     def response(flow: http.HTTPFlow):
-        InterceptorMgr._intercept_core(InterceptorMgr._response_interceptors, flow)
+        InterceptorMgr._intercept_core(InterceptorMgr._response_table, flow)
 
     @staticmethod
-    def _intercept_core(interceptors, flow: http.HTTPFlow):
-        interceptor_list = []
+    def _rebuild_tables():
+        InterceptorMgr._request_table = InterceptorMgr._build_table(0)
+        InterceptorMgr._response_table = InterceptorMgr._build_table(1)
+
+    @staticmethod
+    def _build_table(index):
+        # 按注册顺序排列，同一IP可以对应多个拦截器
+        all_list = []
+        ip_lists = {}
+        for interceptor_id in sorted(InterceptorMgr._registrations.keys()):
+            registration = InterceptorMgr._registrations[interceptor_id]
+            func, ip, intercept_all = registration[index], registration[2], registration[3]
+            if func is None:
+                continue
+            if intercept_all:
+                all_list.append(func)
+                for funcs in ip_lists.values():
+                    funcs.append(func)
+            elif ip != "":
+                if ip not in ip_lists:
+                    ip_lists[ip] = list(all_list)
+                ip_lists[ip].append(func)
+        return tuple(all_list), {ip: tuple(funcs) for ip, funcs in ip_lists.items()}
+
+    @staticmethod
+    def _intercept_core(table, flow: http.HTTPFlow):
+        all_funcs, ip_funcs = table
         client_ip = flow.client_conn.peername[0]
-        with InterceptorMgr._lock:
-            for interceptor_id in interceptors.keys():
-                if interceptors[interceptor_id][1]:
-                    interceptor_list.append(interceptors[interceptor_id][0])
-                else:
-                    if interceptor_id in InterceptorMgr._id_to_ip_dict:
-                        if client_ip == InterceptorMgr._id_to_ip_dict[interceptor_id]:
-                            interceptor_list.append(interceptors[interceptor_id][0])
-        for func in interceptor_list:
+        for func in ip_funcs.get(client_ip, all_funcs):
             try:
                 func(flow)
             except Exception as e:
@@ -85,4 +191,3 @@ class InterceptorMgr:
             {"Content-Type": "text/html"}  # (optional) headers
         )
 
-
@@ -0,0 +1,106 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 多进程MitmDump
+#
+
+import multiprocessing
+import queue
+import threading
+import time
+from mitmproxy import http
+from airtest_ext.interceptor_mgr import InterceptorMgr
+from airtest_ext.mitmproxy_svr import MitmDumpThread, wait_listening
+
+
+class MitmWorkerPool(threading.Thread):
+    """
+    多进程MitmDump：启动多个mitmdump工作进程，每个进程监听各自的端口（port、port+1...），共用同一套证书，
+    TLS解密在各工作进程中完成。工作进程截获的流通过进程间队列转发回本进程，由本线程交给InterceptorMgr分发。
+    注意：拦截器收到的是流的副本，对其修改不会影响实际的请求/响应
+    """
+
+    def __init__(self, name, port=8089, workers=2, cert_path=None, forward_requests=False, max_queue_size=10000,
+                 replay_path=None, replay_timing=False, allow_hosts=None):
+        """
+        :param name: 线程名称
+        :param port: 第一个工作进程的监听端口，其余进程依次加1
+        :param workers: 工作进程数，默认：2
+        :param cert_path: 证书目录，默认：None，即使用内置证书
+        :param forward_requests: 是否转发请求阶段的流（用于请求拦截器），默认：False，仅转发响应
+        :param max_queue_size: 进程间队列的最大长度，队列满时工作进程丢弃新的流，默认：10000
+        :param replay_path: 回放的归档文件路径，各工作进程分别加载归档并应答请求，参见MitmDumpThread，默认：None，即不回放
+        :param replay_timing: 回放时是否按录制时的响应耗时延迟应答，默认：False
+        :param allow_hosts: 只解密这些主机的连接，为mitmproxy的allow_hosts格式的正则数组，启动后不能再修改，
+                            默认：None，即解密全部连接
+        """
+        super(MitmWorkerPool, self).__init__(name=name, daemon=True)
+        self._ports = [port + i for i in range(workers)]
+        self._cert_path = cert_path
+        self._forward_requests = forward_requests
+        self._replay_path = replay_path
+        self._replay_timing = replay_timing
+        self._allow_hosts = list(allow_hosts) if allow_hosts else None
+        # 使用spawn方式启动，避免fork时复制本进程中其他线程持有的锁
+        self._mp_ctx = multiprocessing.get_context('spawn')
+        self._queue = self._mp_ctx.Queue(maxsize=max_queue_size)
+        self._processes = []
+
+    @property
+    def ports(self):
+        return list(self._ports)
+
+    def wait_ready(self, timeout=10):
+        """
+        等待所有工作进程开始监听端口
+
+        :param timeout: 超时时间，单位秒，默认：10
+        :return: 是否都已开始监听
+        """
+        end_time = time.time() + timeout
+        return all(wait_listening(port, timeout=max(end_time - time.time(), 0)) for port in self._ports)
+
+    def run(self):
+        for port in self._ports:
+            p = self._mp_ctx.Process(name=f'mitmdump worker {port}', target=_worker_main, daemon=True,
+                                     args=(port, self._cert_path, self._queue, self._forward_requests,
+                                           self._replay_path, self._replay_timing, self._allow_hosts))
+            p.start()
+            self._processes.append(p)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            event, state = item
+            try:
+                flow = http.HTTPFlow.from_state(state)
+                if event == 'request':
+                    InterceptorMgr.request(flow)
+                else:
+                    InterceptorMgr.response(flow)
+            except Exception as e:
+                print(e)
+
+    def stop(self):
+        for p in self._processes:
+            p.terminate()
+        for p in self._processes:
+            p.join()
+        self._processes = []
+        self._queue.put(None)
+
+
+def _worker_main(port, cert_path, flow_queue, forward_requests, replay_path=None, replay_timing=False,
+                 allow_hosts=None):
+    # 工作进程：注册一个拦截所有IP的转发拦截器，然后在主线程中运行mitmdump
+    def forward(event):
+        def func(flow: http.HTTPFlow):
+            try:
+                flow_queue.put_nowait((event, flow.get_state()))
+            except queue.Full:
+                pass
+        return func
+
+    InterceptorMgr.register_interceptor(forward('request') if forward_requests else None, forward('response'),
+                                        intercept_all=True)
+    MitmDumpThread(f'mitmdump worker {port}', port=port, cert_path=cert_path, replay_path=replay_path,
+                   replay_timing=replay_timing, allow_hosts=allow_hosts).run()
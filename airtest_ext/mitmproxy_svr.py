@@ -6,65 +6,120 @@
 import asyncio
 import os
 from os.path import abspath, dirname
+import re
+import socket
 import threading
+import time
+from urllib.parse import urlparse
 from mitmproxy import ctx
+from mitmproxy.options import Options
+from mitmproxy.tools.dump import DumpMaster
 from mitmproxy.tools import main as mitm_main
+from airtest_ext.interceptor_mgr import InterceptorMgr
+from airtest_ext.flow_replay import FlowReplayer
 
 
 class MitmDumpThread(threading.Thread):
-    def __init__(self, name, port=8089, debug=False, web_host='localhost', web_port=8081, script=None, cert_path=None):
+    def __init__(self, name, port=8089, debug=False, web_host='localhost', web_port=8081, script=None, cert_path=None,
+                 replay_path=None, replay_timing=False, programmatic=True, allow_hosts=None):
+        """
+        :param name: 线程名称
+        :param port: 监听端口，默认：8089
+        :param debug: 是否以mitmweb方式运行，默认：False
+        :param web_host: mitmweb的地址，默认：localhost
+        :param web_port: mitmweb的端口，默认：8081
+        :param script: mitmproxy脚本，默认：None，即使用mitm_callback.py
+        :param cert_path: 证书目录，默认：None，即使用内置证书
+        :param replay_path: 回放的归档文件路径（参见FlowArchive），设置后用归档的流应答请求，不访问真实的服务器，
+                            默认：None，即不回放
+        :param replay_timing: 回放时是否按录制时的响应耗时延迟应答，默认：False
+        :param programmatic: 使用默认脚本的mitmdump是否直接在进程内创建master（不经过命令行解析及脚本加载），默认：True
+        :param allow_hosts: 只解密这些主机的连接，其余连接直接透传，为mitmproxy的allow_hosts格式的正则数组，
+                            默认：None，即解密全部连接
+        """
         super(MitmDumpThread, self).__init__(name=name)
         self._loop = None
         self._debug = debug
         self._port = port
         self._web_host = web_host
         self._web_port = web_port
-        self._script = os.path.join(dirname(abspath(__file__)), "mitm_callback.py") if script is None else script
+        self._default_script = os.path.join(dirname(abspath(__file__)), "mitm_callback.py")
+        self._script = self._default_script if script is None else script
         self._cert_path = os.path.join(dirname(abspath(__file__)), "cert") if cert_path is None else cert_path
+        self._replay_path = replay_path
+        self._replay_timing = replay_timing
+        self._programmatic = programmatic
+        self._allow_hosts = self._get_allow_hosts(allow_hosts)
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+
+    @property
+    def ready(self):
+        """
+        端口开始监听后置位的事件
+        """
+        return self._ready
+
+    def wait_ready(self, timeout=10):
+        """
+        等待mitmproxy开始监听端口
+
+        :param timeout: 超时时间，单位秒，默认：10
+        :return: 是否已开始监听
+        """
+        return self._ready.wait(timeout)
 
     def run(self):
+        replayer_id = None
+        replayer = None
+        threading.Thread(name=f'{self.name} ready watcher', target=self._watch_ready, daemon=True).start()
         try:
             self._loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self._loop)
-            if not self._debug:
-                mitm_main.mitmdump([
-                    "--set",
-                    f"confdir={self._cert_path}",
-                    "--set",
-                    f"console_eventlog_verbosity=warn",
-                    "--set",
-                    f"termlog_verbosity=warn",
-                    "--set",
-                    f"block_global=false",
-                    "--no-ssl-insecure",
-                    "--listen-port",
-                    f"{self._port}",
-                    "--scripts",
-                    self._script
-                ])
+            options = {
+                "confdir": self._cert_path,
+                "termlog_verbosity": "warn",
+                "block_global": False,
+                "ssl_insecure": False,
+                "listen_port": self._port,
+            }
+            if len(self._allow_hosts) > 0:
+                options["allow_hosts"] = self._allow_hosts
+            if self._replay_path is not None:
+                # 回放时不连接上游服务器，直接用证书目录中的CA签发证书
+                replayer = FlowReplayer(self._replay_path, preserve_timing=self._replay_timing)
+                options.update(upstream_cert=False, connection_strategy="lazy")
+            if self._programmatic and self._script == self._default_script and not self._debug:
+                self._run_master(options, replayer)
             else:
-                mitm_main.mitmweb([
-                    "--set",
-                    f"confdir={self._cert_path}",
-                    "--set",
-                    f"console_eventlog_verbosity=warn",
-                    "--set",
-                    f"termlog_verbosity=warn",
-                    "--set",
-                    f"block_global=false",
-                    "--no-ssl-insecure",
-                    "--no-server-replay-refresh",
-                    "--web-host",
-                    self._web_host,
-                    "--web-port",
-                    f"{self._web_port}",
-                    "--listen-port",
-                    f"{self._port}",
-                    "--scripts",
-                    self._script
-                ])
+                if replayer is not None:
+                    # 经脚本加载时，回放器作为拦截器先于其他拦截器注册，此时不支持按录制耗时延迟应答
+                    if self._replay_timing:
+                        print('以脚本方式运行mitmproxy时，回放不支持按录制耗时延迟应答！')
+                    replayer_id = InterceptorMgr.register_interceptor(replayer, None, intercept_all=True)
+                options["console_eventlog_verbosity"] = "warn"
+                if self._debug:
+                    mitm_main.mitmweb(self._get_args(options) + [
+                        "--no-server-replay-refresh",
+                        "--web-host",
+                        self._web_host,
+                        "--web-port",
+                        f"{self._web_port}",
+                        "--scripts",
+                        self._script
+                    ])
+                else:
+                    mitm_main.mitmdump(self._get_args(options) + [
+                        "--scripts",
+                        self._script
+                    ])
         except BaseException as eee:
             print(eee)
+        finally:
+            self._stopped.set()
+            InterceptorMgr.unregister_interceptor(replayer_id)
+            if replayer is not None:
+                replayer.close()
 
     @staticmethod
     def stop():
@@ -72,3 +127,83 @@ class MitmDumpThread(threading.Thread):
             ctx.master.shutdown()
         except BaseException:
             pass
+
+    def set_allow_hosts(self, allow_hosts):
+        """
+        更新要解密的主机，只影响之后建立的连接
+
+        :param allow_hosts: mitmproxy的allow_hosts格式的正则数组，为None或空数组时解密全部连接
+        :return: 无
+        """
+        allow_hosts = self._get_allow_hosts(allow_hosts)
+        if allow_hosts == self._allow_hosts:
+            return
+        self._allow_hosts = allow_hosts
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            # mitmproxy的选项只能在其事件循环中修改
+            loop.call_soon_threadsafe(self._apply_allow_hosts, allow_hosts)
+
+    @staticmethod
+    def _apply_allow_hosts(allow_hosts):
+        try:
+            ctx.master.options.update(allow_hosts=allow_hosts)
+        except BaseException as eee:
+            print(eee)
+
+    @staticmethod
+    def _get_allow_hosts(allow_hosts):
+        if not allow_hosts:
+            return []
+        # 内部控制请求的主机始终解密
+        internal_host = rf'^{re.escape(urlparse(InterceptorMgr._internal_url).hostname)}(?::\d+)?$'
+        return list(allow_hosts) + [internal_host] if internal_host not in allow_hosts else list(allow_hosts)
+
+    @staticmethod
+    def _get_args(options):
+        args = []
+        for key, value in options.items():
+            for v in value if isinstance(value, list) else [value]:
+                v = str(v).lower() if isinstance(v, bool) else v
+                args += ["--set", f"{key}={v}"]
+        return args
+
+    def _run_master(self, options, replayer=None):
+        # 直接创建mitmproxy的master，并以addon对象的方式注册InterceptorMgr，省去命令行解析及脚本加载。
+        # 在事件循环外创建master并同步调用run()只适用于mitmproxy 7（8起master需在运行中的事件循环内创建，
+        # run()为协程），setup.py及requirements.txt中限定了mitmproxy 7
+        master = DumpMaster(Options(), with_termlog=True, with_dumper=False)
+        master.addons.add(InterceptorMgr())
+        if replayer is not None:
+            # 回放器在InterceptorMgr之后处理请求，跳过已被应答的内部控制请求
+            master.addons.add(replayer)
+        master.options.update(**options)
+        master.run()
+
+    def _watch_ready(self):
+        while not self._stopped.is_set():
+            if wait_listening(self._port, timeout=0.1):
+                self._ready.set()
+                break
+
+
+def wait_listening(port, host='127.0.0.1', timeout=10, interval=0.05):
+    """
+    等待端口开始监听
+
+    :param port: 端口
+    :param host: 地址，默认：127.0.0.1
+    :param timeout: 超时时间，单位秒，默认：10
+    :param interval: 检测间隔，单位秒，默认：0.05
+    :return: 是否已开始监听
+    """
+    end_time = time.time() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=max(end_time - time.time(), interval)):
+                return True
+        except OSError:
+            pass
+        if time.time() + interval > end_time:
+            return False
+        time.sleep(interval)
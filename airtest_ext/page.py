@@ -109,7 +109,7 @@ class Fragment:
         if self._features:
             return exists(self._features, timeout=timeout)
         else:
-            sleep(timeout)
+            wait_screen_stable(timeout=timeout)
             return True
 
     def run_script(self, auto_back=True, **kwargs):
@@ -123,6 +123,94 @@ class Fragment:
         pass
 
 
+class PageClassifier:
+    """
+    页面分类器，由所有页面及片段的特征图构建。每次只截屏一次，在同一张截图上批量匹配各页面/片段的特征，
+    返回最可能的当前页面
+    """
+
+    def __init__(self, pages):
+        """
+        :param pages: 页面数组
+        """
+        # 名称 -> (页面, 片段)，没有特征图的页面/片段无法识别，不加入
+        self._targets = {}
+        self._features = {}
+        for page in pages:
+            if page.features:
+                self._add(page, None, page.features)
+            for fragment in page.fragments:
+                if fragment.features:
+                    self._add(page, fragment, fragment.features)
+
+    def classify(self, candidates=None, device=None, screen=None, threshold=None):
+        """
+        截屏一次，识别当前页面
+
+        :param candidates: 候选的 (页面, 片段) 数组，片段为None时表示页面本身，默认：None，即所有页面及片段
+        :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+        :param screen: 屏幕截图，如果为None则自动截屏，默认:None
+        :param threshold: 图像匹配的信度阈值
+        :return: 匹配到的 [(页面, 片段, 匹配信息)]，按可能性从高到低排列，没有匹配时为空数组
+        """
+        features = self._get_features(candidates)
+        return self._sort_results(find_features_in_screen(features, device=device, screen=screen,
+                                                          threshold=threshold))
+
+    def wait(self, candidates=None, device=None, timeout=10, threshold=None, interval=0.5, poll=None):
+        """
+        等待任一候选页面出现，每次尝试只截屏一次，直到超时为止
+
+        :param candidates: 候选的 (页面, 片段) 数组，默认：None，即所有页面及片段
+        :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+        :param timeout: 超时时间，默认：10
+        :param threshold: 图像匹配的信度阈值
+        :param interval: 轮询间隔，单位秒，默认：0.5
+        :param poll: 轮询策略，PollStrategy实例，默认：None
+        :return: 匹配到的 [(页面, 片段, 匹配信息)]，按可能性从高到低排列，超时为空数组
+        """
+        features = self._get_features(candidates)
+        return self._sort_results(exists_features(features, device=device, timeout=timeout, threshold=threshold,
+                                                  interval=interval, poll=poll))
+
+    def contains(self, page, fragment=None):
+        """
+        页面（片段）是否可以识别，即是否定义了特征图
+        """
+        return self._get_name(page, fragment) in self._targets
+
+    def _add(self, page, fragment, features):
+        name = self._get_name(page, fragment)
+        self._targets[name] = (page, fragment)
+        self._features[name] = features
+
+    def _get_features(self, candidates):
+        if candidates is None:
+            return dict(self._features)
+        features = {}
+        for page, fragment in candidates:
+            name = self._get_name(page, fragment)
+            if name in self._features:
+                features[name] = self._features[name]
+        return features
+
+    def _sort_results(self, match_infos):
+        results = [(self._targets[name][0], self._targets[name][1], match_info)
+                   for name, match_info in match_infos.items() if match_info]
+        # 信度高的优先，信度相同时片段优先于其所在的页面
+        results.sort(key=lambda r: (self._get_confidence(r[2]), r[1] is not None), reverse=True)
+        return results
+
+    @staticmethod
+    def _get_name(page, fragment):
+        return f'{page.name}/{fragment.name}' if fragment is not None else page.name
+
+    @staticmethod
+    def _get_confidence(match_info):
+        results = match_info.get('results') if isinstance(match_info, dict) else None
+        return results[0].get('confidence', 0) if results else 0
+
+
 class Page:
     """
     页面类，包括了特征图、锚点、片段和脚本的定义
@@ -154,6 +242,14 @@ class Page:
     def name(self):
         return self._name
 
+    @property
+    def features(self):
+        return self._features
+
+    @property
+    def fragments(self):
+        return list(self._fragments.values())
+
     def get_fragment(self, fragment_name):
         return self._fragments[fragment_name] if fragment_name in self._fragments else None
 
@@ -200,31 +296,14 @@ class Page:
         is_succ = touch(v)
         if is_succ:
             if run_script:
-                for dest in self._anchors[anchor_name].to_wheres:
-                    page = self._bot.get_page(dest.page_name)
-                    if page != self:
-                        if dest.fragment_name:
-                            fragment = page.get_fragment(dest.fragment_name)
-                            if fragment.is_active(timeout=timeout):
-                                fragment.run_script(auto_back=auto_back, **kwargs)
-                                break
-                        else:
-                            if page.is_active(timeout=timeout):
-                                page.run_script(auto_back=auto_back, **kwargs)
-                                break
-                    else:
-                        if dest.fragment_name:
-                            fragment = page.get_fragment(dest.fragment_name)
-                            if fragment.is_active(timeout=timeout):
-                                fragment.run_script(auto_back=False, **kwargs)
-                                break
-                        else:
-                            sleep(timeout)
-                            if page.is_active(timeout=0):
-                                break
-                        timeout = 0
-                else:
+                dest = self._resolve_destination(self._anchors[anchor_name].to_wheres, timeout)
+                if dest is None:
                     raise_exception(TouchFailedException(f"程序异常：没有进入锚点的目标页，请检查锚点目标页特征图是否配置正确或有误遗漏的目标页!"))
+                page, fragment = dest
+                if fragment is not None:
+                    fragment.run_script(auto_back=auto_back if page != self else False, **kwargs)
+                elif page != self:
+                    page.run_script(auto_back=auto_back, **kwargs)
         else:
             raise_exception(TouchFailedException(f"程序异常：点击失败，请检查特征图匹配结果或目标区域是否合法!"))
 
@@ -242,9 +321,16 @@ class Page:
             raise_exception(FragmentNotFoundException(f"程序异常：片段[{fragment_name}]没有定义，请检查片段定义及片段列表!"))
         features = self._fragments[fragment_name].features if fragment_name else self._features
         home_anchors = self._find_anchors_by_fragment([fragment_name])
-        while not exists(features, timeout=5):
+        # 目标特征与各锚点共用一次截屏进行匹配
+        check_features = {'__target__': features}
+        for anchor in home_anchors:
+            check_features[anchor.name] = anchor.feature
+        while True:
+            match_infos = exists_features(check_features, timeout=5)
+            if match_infos['__target__']:
+                break
             for anchor in home_anchors:
-                if exists(anchor.feature, timeout=0.1):
+                if match_infos[anchor.name]:
                     self.touch_anchor(anchor.name, auto_back=False, run_script=False)
                     break
             else:
@@ -256,6 +342,79 @@ class Page:
         if auto_back:
             go_back()
 
+    def _resolve_destination(self, to_wheres, timeout):
+        """
+        确定点击锚点后进入的目标页，所有目标页共用一次截屏进行识别
+
+        :param to_wheres: ToWhere数组
+        :param timeout: 等待超时时间
+        :return: (页面, 片段)，片段为None时表示页面本身，没有进入任一目标页时返回None
+        """
+        classifier = self._bot.get_page_classifier()
+        candidates = []
+        for dest in to_wheres:
+            page = self._bot.get_page(dest.page_name)
+            candidates.append((page, page.get_fragment(dest.fragment_name) if dest.fragment_name else None))
+        if not all(classifier.contains(page, fragment) for page, fragment in candidates):
+            # 有目标页没有特征图，无法识别，按原顺序逐个判断
+            return self._resolve_destination_serially(candidates, timeout)
+
+        if (self, None) not in candidates:
+            results = classifier.wait(candidates, timeout=timeout)
+            # 同一次截屏中匹配到多个目标时，取可能性最高的一个
+            return results[0][:2] if len(results) > 0 else None
+        return self._wait_destination_stable(classifier, candidates, timeout)
+
+    def _wait_destination_stable(self, classifier, candidates, timeout, min_wait=0.2, interval=0.1):
+        """
+        候选目标中包含留在本页面时使用：本页面的特征在点击前就已匹配，需在其他目标都未出现且屏幕稳定后才能确定。
+        每帧检查屏幕是否稳定，画面有变化时才重新识别，其他目标出现或屏幕稳定后立即返回
+
+        :param classifier: 页面分类器
+        :param candidates: 候选的 (页面, 片段) 数组
+        :param timeout: 等待超时时间
+        :param min_wait: 最短等待时间，避免界面尚未开始变化就判定为留在本页面，单位秒，默认：0.2
+        :param interval: 截屏间隔，单位秒，默认：0.1
+        :return: (页面, 片段)，没有进入任一目标页时返回None
+        """
+        start_time = time.time()
+        checker = ScreenStableChecker()
+        results = []
+        time.sleep(min(min_wait, timeout))
+        while True:
+            screen = get_screen()
+            now = time.time()
+            is_stable = checker.update(screen, now)
+            if screen is not None and checker.changed:
+                results = classifier.classify(candidates, screen=screen)
+                for page, fragment, _ in results:
+                    if (page, fragment) != (self, None):
+                        return page, fragment
+            if len(results) > 0 and (is_stable or now - start_time >= timeout):
+                return results[0][:2]
+            if now - start_time >= timeout:
+                return None
+            time.sleep(min(interval, max(timeout - (now - start_time), 0)))
+
+    def _resolve_destination_serially(self, candidates, timeout):
+        for page, fragment in candidates:
+            if page != self:
+                if fragment is not None:
+                    if fragment.is_active(timeout=timeout):
+                        return page, fragment
+                elif page.is_active(timeout=timeout):
+                    return page, None
+            else:
+                if fragment is not None:
+                    if fragment.is_active(timeout=timeout):
+                        return page, fragment
+                else:
+                    wait_screen_stable(timeout=timeout)
+                    if page.is_active(timeout=0):
+                        return page, None
+                timeout = 0
+        return None
+
     def _find_anchors_by_fragment(self, fragment_names):
         anchors = []
         for fragment_name in fragment_names:
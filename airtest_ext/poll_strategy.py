@@ -0,0 +1,193 @@
+#! /usr/bin/python
+# -*-coding: UTF-8 -*-
+# 轮询策略：决定 exists/wait/touch 等待特征图时每次尝试之间的间隔
+#
+
+import threading
+from collections import OrderedDict
+
+
+class PollStrategy:
+    """
+    轮询策略基类
+    """
+
+    def intervals(self, query):
+        """
+        生成每次匹配失败后的等待间隔
+
+        :param query: 要匹配的特征图
+        :return: 等待间隔（秒）的生成器
+        """
+        raise NotImplementedError
+
+    def on_found(self, query, elapsed):
+        """
+        匹配成功后的回调，可用于学习特征图的出现延时
+
+        :param query: 要匹配的特征图
+        :param elapsed: 从开始等待到匹配成功的时间，单位秒
+        :return: 无
+        """
+        pass
+
+
+class FixedPoll(PollStrategy):
+    """
+    固定间隔轮询
+    """
+
+    def __init__(self, interval=0.5):
+        """
+        :param interval: 轮询间隔，单位秒，默认：0.5
+        """
+        self._interval = interval
+
+    def intervals(self, query):
+        while True:
+            yield self._interval
+
+
+class BackoffPoll(PollStrategy):
+    """
+    指数退避轮询，间隔从 initial 开始按 factor 倍增长，直到 max_interval
+    """
+
+    def __init__(self, initial=0.1, factor=2.0, max_interval=2.0):
+        """
+        :param initial: 初始间隔，单位秒，默认：0.1
+        :param factor: 间隔增长倍数，默认：2.0
+        :param max_interval: 最大间隔，单位秒，默认：2.0
+        """
+        self._initial = initial
+        self._factor = factor
+        self._max_interval = max_interval
+
+    def intervals(self, query):
+        interval = self._initial
+        while True:
+            yield interval
+            interval = min(interval * self._factor, self._max_interval)
+
+
+class FastFirstPoll(PollStrategy):
+    """
+    先快后慢轮询，在 fast_duration 时间内按 fast_interval 轮询，之后按 slow_interval 轮询
+    """
+
+    def __init__(self, fast_interval=0.1, fast_duration=1.0, slow_interval=1.0):
+        """
+        :param fast_interval: 快速轮询间隔，单位秒，默认：0.1
+        :param fast_duration: 快速轮询持续时间，单位秒，默认：1.0
+        :param slow_interval: 慢速轮询间隔，单位秒，默认：1.0
+        """
+        self._fast_interval = fast_interval
+        self._fast_duration = fast_duration
+        self._slow_interval = slow_interval
+
+    def intervals(self, query):
+        elapsed = 0
+        while True:
+            interval = self._fast_interval if elapsed < self._fast_duration else self._slow_interval
+            elapsed += interval
+            yield interval
+
+
+class LearnedPoll(PollStrategy):
+    """
+    自学习轮询，按特征图记录历次出现的延时（指数滑动平均），在预计出现的时刻附近快速轮询，其余时间慢速轮询。
+    特征图按文件的完整路径识别（不同目录下的同名文件互不影响），只传入图像的特征图按实例识别，
+    数组/元组/字典按其中各特征图（及名称）识别；无法识别的特征图不学习。
+    没有历史记录的特征图按 default_interval 固定间隔轮询
+    """
+
+    def __init__(self, default_interval=0.5, min_interval=0.1, max_interval=2.0, alpha=0.3, max_size=256):
+        """
+        :param default_interval: 没有历史记录时的轮询间隔，单位秒，默认：0.5
+        :param min_interval: 预计出现时刻附近的轮询间隔，单位秒，默认：0.1
+        :param max_interval: 超过预计出现时刻较久后的最大轮询间隔，单位秒，默认：2.0
+        :param alpha: 出现延时的滑动平均系数，默认：0.3
+        :param max_size: 最多记录的特征图数量，超过时淘汰最久未使用的记录，默认：256
+        """
+        self._default_interval = default_interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._alpha = alpha
+        self._max_size = max_size
+        self._delays = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_delay(self, query):
+        """
+        获取特征图的预计出现延时
+
+        :param query: 特征图
+        :return: 预计出现延时，单位秒，没有历史记录时返回None
+        """
+        key = self._get_key(query)
+        if key is None:
+            return None
+        with self._lock:
+            if key not in self._delays:
+                return None
+            self._delays.move_to_end(key)
+            return self._delays[key]
+
+    def intervals(self, query):
+        delay = self.get_delay(query)
+        if delay is None:
+            while True:
+                yield self._default_interval
+
+        elapsed = 0
+        while True:
+            if elapsed < delay * 0.8:
+                # 预计出现之前：直接等到接近预计出现的时刻
+                interval = max(delay * 0.8 - elapsed, self._min_interval)
+            elif elapsed < delay * 1.5:
+                interval = self._min_interval
+            else:
+                # 超出预计出现时刻较久：逐步放慢
+                interval = min(max((elapsed - delay) / 2, self._min_interval), self._max_interval)
+            elapsed += interval
+            yield interval
+
+    def on_found(self, query, elapsed):
+        key = self._get_key(query)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._delays:
+                self._delays[key] = self._delays[key] * (1 - self._alpha) + elapsed * self._alpha
+                self._delays.move_to_end(key)
+            else:
+                self._delays[key] = elapsed
+                while len(self._delays) > self._max_size:
+                    self._delays.popitem(last=False)
+
+    @staticmethod
+    def _get_key(query):
+        """
+        获取特征图的记录键，由特征图的内容（文件路径、名称）决定，每次调用时新建的数组/字典也能得到相同的键
+
+        :param query: 特征图、特征图数组/元组、{名称: 特征图}字典或Feature实例数组
+        :return: 记录键，无法识别时返回None
+        """
+        if isinstance(query, dict):
+            names = sorted(query.keys(), key=str)
+            keys = [LearnedPoll._get_key(query[name]) for name in names]
+            return ('dict', tuple(zip(map(str, names), keys))) if None not in keys else None
+        elif isinstance(query, (list, tuple)):
+            keys = [LearnedPoll._get_key(v) for v in query]
+            return (type(query).__name__, tuple(keys)) if None not in keys else None
+        elif hasattr(query, 'name') and hasattr(query, 'feature'):
+            # Feature实例
+            key = LearnedPoll._get_key(query.feature)
+            return ('feature', query.name, key) if key is not None else None
+        filepath = getattr(query, '_filepath', None)
+        if filepath:
+            return filepath
+        if getattr(query, 'filename', None) is None and getattr(query, '_img', None) is not None:
+            # 只传入图像的模板没有文件路径，按实例识别
+            return 'image', id(query)
+        return getattr(query, 'filename', None) or None
@@ -3,6 +3,8 @@
 
 import os
 import inspect
+import threading
+from collections import OrderedDict
 from airtest.core.cv import Template as TemplateBase, loop_find as loop_find_core, try_log_screen
 from airtest.utils.transform import TargetPos
 from airtest.core.settings import Settings as ST  # noqa
@@ -27,6 +29,8 @@ class Template(TemplateBase):
     scale_step: 多尺度模板匹配搜索步长.
     """
     DEFAULT_THRESHOLD = 0.95
+    # 每个模板缓存的缩放图数量上限（按屏幕分辨率及缩放方法区分）
+    RESIZE_CACHE_SIZE = 4
 
     def __init__(self, filename, img=None, threshold=None, target_pos=TargetPos.MID, record_pos=None, resolution=(),
                  rgb=False, scale_max=800, scale_step=0.005):
@@ -37,20 +41,23 @@ class Template(TemplateBase):
         if self.filename:
             self._filepath = os.path.join(os.path.dirname(os.path.abspath(self._caller_module.__file__)), self.filename)
         self._img = img
+        self._resized_cache = OrderedDict()
+        self._resized_cache_lock = threading.Lock()
 
-    def match_best_in(self, screen, in_rect=None):
-        image = self._imread()
-        image = self._resize_image(image, screen, ST.RESIZE_METHOD)
+    def match_best_in(self, screen, in_rect=None, threshold=None):
+        image = self._get_resized_image(screen)
+        # 只对本次匹配使用传入的阈值，不修改模板本身的阈值
+        threshold = threshold or self.threshold
 
         if in_rect is None:
-            result = self._find_best_template(image, screen)
+            result = self._find_best_template(image, screen, threshold)
         else:
             pos_left_top = (int(in_rect[0][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
                             int(in_rect[0][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
             pos_right_bottom = (int(in_rect[1][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
                                 int(in_rect[1][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
             img_part = screen[pos_left_top[1]: pos_right_bottom[1], pos_left_top[0]: pos_right_bottom[0]]
-            result = self._find_best_template(image, img_part)
+            result = self._find_best_template(image, img_part, threshold)
             if result is not None:
                 result['result'] =(result['result'][0] + pos_left_top[0], result['result'][1] + pos_left_top[1])
                 rectangle = ((result["rectangle"][0][0] + pos_left_top[0], result["rectangle"][0][1] + pos_left_top[1]),
@@ -62,21 +69,21 @@ class Template(TemplateBase):
         G.LOGGING.debug("match result: %s", result)
         focus_pos = TargetPos().getXY(result, self.target_pos) if result else None
         results = [result] if result else None
-        return dict(results=results, pos=focus_pos, feature=self, screen=screen)
+        return dict(results=results, pos=focus_pos, feature=self, screen=screen, threshold=threshold)
 
-    def match_all_in(self, screen, in_rect=None):
-        image = self._imread()
-        image = self._resize_image(image, screen, ST.RESIZE_METHOD)
+    def match_all_in(self, screen, in_rect=None, threshold=None):
+        image = self._get_resized_image(screen)
+        threshold = threshold or self.threshold
 
         if in_rect is None:
-            results = self._find_all_template(image, screen)
+            results = self._find_all_template(image, screen, threshold)
         else:
             pos_left_top = (int(in_rect[0][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
                             int(in_rect[0][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
             pos_right_bottom = (int(in_rect[1][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
                                 int(in_rect[1][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
             img_part = screen[pos_left_top[1]: pos_right_bottom[1], pos_left_top[0]: pos_right_bottom[0]]
-            results = self._find_all_template(image, img_part)
+            results = self._find_all_template(image, img_part, threshold)
             if results is not None:
                 for result in results:
                     result['result'] =(result['result'][0] + pos_left_top[0], result['result'][1] + pos_left_top[1])
@@ -85,19 +92,48 @@ class Template(TemplateBase):
                                  (result["rectangle"][2][0] + pos_left_top[0], result["rectangle"][2][1] + pos_left_top[1]),
                                  (result["rectangle"][3][0] + pos_left_top[0], result["rectangle"][3][1] + pos_left_top[1]))
                     result["rectangle"] = rectangle
-        return dict(results=results, feature=self, screen=screen)
+        return dict(results=results, feature=self, screen=screen, threshold=threshold)
 
     def get_image(self):
         return self._imread()
 
+    def get_resized_size(self, screen):
+        """
+        获取按当前屏幕分辨率缩放后的模板图尺寸
+
+        :param screen: 屏幕截图
+        :return: (高, 宽)
+        """
+        return self._get_resized_image(screen).shape[:2]
+
     def get_caller_module(self):
         return self._caller_module
 
-    def _find_best_template(self, image, screen):
-        return TemplateMatching(image, screen, threshold=self.threshold, rgb=self.rgb).find_best_result()
-
-    def _find_all_template(self, image, screen):
-        return TemplateMatching(image, screen, threshold=self.threshold, rgb=self.rgb).find_all_results()
+    def _find_best_template(self, image, screen, threshold):
+        return TemplateMatching(image, screen, threshold=threshold, rgb=self.rgb).find_best_result()
+
+    def _find_all_template(self, image, screen, threshold):
+        return TemplateMatching(image, screen, threshold=threshold, rgb=self.rgb).find_all_results()
+
+    def _get_resized_image(self, screen):
+        """
+        获取按当前屏幕分辨率缩放后的模板图，结果按 (屏幕分辨率, 缩放方法) 做LRU缓存
+
+        :param screen: 屏幕截图
+        :return: 缩放后的模板图
+        """
+        key = (screen.shape[0], screen.shape[1], ST.RESIZE_METHOD)
+        with self._resized_cache_lock:
+            if key in self._resized_cache:
+                self._resized_cache.move_to_end(key)
+                return self._resized_cache[key]
+        image = self._resize_image(self._imread(), screen, ST.RESIZE_METHOD)
+        with self._resized_cache_lock:
+            self._resized_cache[key] = image
+            self._resized_cache.move_to_end(key)
+            while len(self._resized_cache) > Template.RESIZE_CACHE_SIZE:
+                self._resized_cache.popitem(last=False)
+        return image
 
     def _imread(self):
         if self._img is None:
@@ -2,12 +2,14 @@
 # -*-coding: UTF-8 -*-
 
 import os
+import sys
 import time
 import base64
 import json
 import threading
-import inspect
+import cv2
 import xlwt
+from concurrent.futures import ThreadPoolExecutor
 from airtest import aircv
 from airtest.core.api import connect_device, device as device_core, set_current, sleep
 from airtest.core.error import TargetNotFoundError
@@ -15,6 +17,7 @@ from airtest.core.settings import Settings as ST
 from airtest.utils.compat import script_log_dir
 from airtest.core.helper import (G, delay_after_operation, import_device_cls, set_logdir, using, log)
 from airtest_ext.template import Template
+from airtest_ext.poll_strategy import FixedPoll
 
 import math
 
@@ -22,6 +25,34 @@ import math
 class DataFormatErrorException(BaseException): pass
 
 
+class DebugStack:
+    """
+    调试事件的调用栈
+
+    仅保存帧引用及其行号等轻量信息，不读取源码行，调试器需要时再按帧所在的模块读取源码。
+    元素格式与 inspect.stack() 兼容：item[0] 为帧对象，item[1] 为文件名，item[2] 为行号，item[3] 为函数名
+    """
+
+    def __init__(self, skip=0):
+        """
+        :param skip: 跳过的栈帧数量，默认：0，即从创建本对象的帧开始记录
+        """
+        self._frames = []
+        frame = sys._getframe(skip + 1)
+        while frame is not None:
+            code = frame.f_code
+            self._frames.append((frame, code.co_filename, frame.f_lineno, code.co_name))
+            frame = frame.f_back
+
+    def __getitem__(self, index):
+        return self._frames[index]
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def __len__(self):
+        return len(self._frames)
+
 
 # 注册的调试器
 _debuggers = {}
@@ -47,6 +78,75 @@ def unregister_debugger(name):
             return False
 
 
+# 并行匹配特征图的线程池，按设备注册
+_match_executors = {}
+
+
+def set_match_executor(executor, device=None):
+    """
+    设置并行匹配特征图的线程池，设置后对数组/元组形式的特征图在同一张截图上并行匹配
+
+    :param executor: concurrent.futures.Executor实例，为None时取消设置
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :return: 无
+    """
+    dev = device if device else G.DEVICE
+    with _lock:
+        if executor is None:
+            _match_executors.pop(dev, None)
+        else:
+            _match_executors[dev] = executor
+
+
+def _get_match_executor(device=None):
+    # 调试器需要按顺序接收匹配事件，此时不并行
+    if not _match_executors or _debuggers:
+        return None
+    return _match_executors.get(device if device else G.DEVICE)
+
+
+# 后台截屏线程，按设备注册
+_screen_captures = {}
+# 各设备最后一次操作（点击、滑动、按键等）完成的时刻
+_last_action_times = {}
+
+
+def set_screen_capture(capture, device=None):
+    """
+    设置设备的后台截屏线程，设置后匹配时读取其最新帧，不再单独截屏
+
+    :param capture: ScreenCaptureThread实例，为None时取消设置
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :return: 无
+    """
+    dev = device if device else G.DEVICE
+    with _lock:
+        if capture is None:
+            _screen_captures.pop(dev, None)
+        else:
+            _screen_captures[dev] = capture
+
+
+def get_screen(device=None):
+    """
+    获取当前屏幕截图，设置了后台截屏线程时，返回晚于该设备最后一次操作的最新帧；后台截屏停滞时直接从设备截屏
+
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :return: 屏幕截图，失败时返回None
+    """
+    dev = device if device else G.DEVICE
+    capture = _screen_captures.get(dev)
+    if capture is not None and capture.is_alive() and not capture.is_stale:
+        _, screen = capture.get_frame(newer_than=_last_action_times.get(dev))
+        if screen is not None:
+            return screen
+    return dev.snapshot(filename=None, quality=ST.SNAPSHOT_QUALITY)
+
+
+def _mark_action(device=None):
+    _last_action_times[device if device else G.DEVICE] = time.time()
+
+
 def auto_setup(basedir=None, device_uri=None, logdir=None, project_root=None, compress=None):
     """
     Auto setup running env and try connect android device if not device connected.
@@ -294,6 +394,7 @@ def double_click(v, device=None):
         pos = v
     dev = device if device else G.DEVICE
     dev.double_click(pos)
+    _mark_action(device)
     delay_after_operation()
     return pos
 
@@ -320,6 +421,7 @@ def pinch(device=None, in_or_out='in', center=None, percent=0.5):
     """
     dev = device if device else G.DEVICE
     dev.pinch(in_or_out=in_or_out, center=center, percent=percent)
+    _mark_action(device)
     delay_after_operation()
 
 
@@ -333,17 +435,25 @@ def goto_home_page(feature, device=None, threshold=0.95, home_anchor=None):
     :argument home_anchor: 首页首屏锚点特征图，若不存在其他Fragment(片段)则可以不填，默认:None
     :return 无
     """
-    # 判断是否在首页
-    while not exists(feature, device=device, timeout=5, threshold=threshold):
-        if home_anchor is not None and exists(home_anchor, device=device, timeout=1):
-            touch(home_anchor, device=device)
+    # 判断是否在首页，首页特征与首页锚点共用一次截屏进行匹配
+    features = {'home': feature}
+    if home_anchor is not None:
+        features['home_anchor'] = home_anchor
+    while True:
+        # 阈值只用于首页特征，锚点仍按其自身的阈值匹配
+        match_infos = exists_features(features, device=device, timeout=5, threshold={'home': threshold})
+        if match_infos['home']:
+            break
+        elif match_infos.get('home_anchor'):
+            touch(match_infos['home_anchor']['pos'], device=device)
         else:
             go_back(device=device)
 
 
 def swipe(v, v2=None, vector=None, device=None, search_mode=False, search_f=None, bottom_f=None, search_in_rect=None,
           before_swipe=None, after_swipe=None, on_result=None, max_error_rate=None, max_hit_count=0, max_swipe_count=0,
-          min_confidence=0.95, interval=1, **kwargs):
+          min_confidence=0.95, interval=1, stop_when_still=True, adaptive_swipe=False, stitch_mode=False,
+          pipelined=False, **kwargs):
     """
     在手机屏幕上模拟滑动
 
@@ -366,12 +476,22 @@ def swipe(v, v2=None, vector=None, device=None, search_mode=False, search_f=None
     :param after_swipe: 滑动搜索模式下，每次滑动后的回调函数
     :param on_result: 滑动搜索模式下，搜索到特征图片后的回调函数，参数为json格式的匹配图片的结果信息，图片的绝对位置信息存放在其 result 字段中。
                       匹配结果信息的结构：{'results': [result], 'pos': focus_pos, 'feature': self, 'screen': screen}
-    :param max_error_rate: 滑动搜索模式下，设定匹配位置的最大误差率，在误差率范围内的则视为同一图片，该参数是通常可以不设置。
-                           它主要是解决当滑动距离较短时匹配结果包含上次匹配到的内容，这是需要消重，该参数则在消重时使用
+    :param max_error_rate: 滑动搜索模式下，设定匹配位置的最大误差率（相对于滑动距离），在误差率范围内的则视为同一图片，该参数是通常可以不设置。
+                           消重时按估计出的实际滚动位移将匹配位置换算为内容坐标，与已处理过的位置比较，
+                           不设置时以匹配区域较短边的一半作为最大误差
     :param max_hit_count: 滑动搜索模式下，设定匹配到多少次后结束滑动
     :param max_swipe_count: 滑动搜索模式下，设定滑动次数
     :param min_confidence: 滑动搜索模式下，设定匹配图片的信度阈值
     :param interval: 滑动搜索模式下，设定滑动间隔时间，单位为秒
+    :param stop_when_still: 滑动搜索模式下，连续两次滑动后列表都没有移动（已到底部）时自动结束，默认：True
+    :param adaptive_swipe: 滑动搜索模式下，相邻两帧重叠较多（滑动后内容移动不足区域高度的一半）时自动加长滑动距离，
+                           重叠过少（移动超过区域高度的90%）时自动缩短滑动距离，无法估计移动距离时恢复为原滑动距离，
+                           默认：False
+    :param stitch_mode: 滑动搜索模式下，按估计出的滚动位移将各帧拼接为一张虚拟的长画布，每次只在新出现的区域
+                        （向上多留一个特征图的高度）中匹配，默认：False。匹配结果的 result 仍为屏幕坐标，
+                        canvas_result 为画布（内容）坐标
+    :param pipelined: 滑动搜索模式下，当前帧在工作线程中匹配的同时进行下一次滑动，上一帧的结果在下一帧截屏后按顺序回调，
+                      默认：False。仅适用于回调中不点击屏幕的场景（如只收集位置）；到达底部或回调要求结束时会多滑动一次
     :param **kwargs: platform specific `kwargs`, please refer to corresponding docs
     :raise Exception: general exception when not enough parameters to perform swap action have been provided
     :return: Origin position and target position
@@ -395,47 +515,65 @@ def swipe(v, v2=None, vector=None, device=None, search_mode=False, search_f=None
     v = _convert_swipe_v(v, device=device)
     v2 = _convert_swipe_v(v2, device=device)
     if search_mode:
-        hit_count = 0
+        search = _SwipeSearch(v, v2, device=device, search_f=search_f, bottom_f=bottom_f,
+                              search_in_rect=search_in_rect, on_result=on_result, max_error_rate=max_error_rate,
+                              max_hit_count=max_hit_count, min_confidence=min_confidence,
+                              stop_when_still=stop_when_still, adaptive_swipe=adaptive_swipe, stitch_mode=stitch_mode,
+                              **kwargs)
         swipe_count = 0
-        last_pos_info = None
+        # 流水线模式下，当前帧在工作线程中匹配的同时进行下一次滑动，上一帧的结果在下一帧截屏后按顺序回调
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='airtest swipe matcher') if pipelined \
+            else None
+        pending = None
+        # 得到当前帧的那次滑动所用的终点；滑动终点只在本线程中调整，工作线程只使用传入的终点
+        swipe_v2 = search.v2
 
         sleep(interval)
-        while max_swipe_count == 0 or swipe_count < max_swipe_count:
-            _set_debug_event('api_start',
-                             data={'api': 'swipe', 'action': '滑动匹配(swipe)', 'status': '执行中...', 'has_sub_event': True})
-            pos_info = find_all_in_screen(search_f, device=device, in_rect=search_in_rect, threshold=min_confidence)[
-                'results']
-            bottom_pos_info = None if bottom_f is None else \
-                find_all_in_screen(bottom_f, device=device, in_rect=search_in_rect, threshold=min_confidence)['results']
-            new_items = _get_new_item(pos_info, last_pos_info, bottom_pos_info, v2[1] - v[1],
-                                      max_error_rate=max_error_rate)
-            _set_debug_event('api_end', data={'api': 'swipe', 'status': f'结果:{len(new_items)}'})
-            if on_result is not None:
-                for item in new_items:
-                    if max_hit_count == 0 or hit_count < max_hit_count:
-                        go_on = on_result(item, **kwargs)
-                        if not go_on:
-                            return
-                    hit_count += 1
-                    if 0 < max_hit_count <= hit_count:
+        try:
+            while max_swipe_count == 0 or swipe_count < max_swipe_count:
+                screen = get_screen(device=device)
+                if screen is None:
+                    G.LOGGING.warning("Screen is None, may be locked")
+                    break
+                if executor is None:
+                    new_items, is_end, offset = search.process(screen, swipe_v2)
+                    search.adapt(offset, screen)
+                    if is_end is None or not search.deliver(new_items) or is_end:
                         return
-            if bottom_pos_info is not None and len(bottom_pos_info) > 0:
-                return
-            last_pos_info = pos_info
-            if before_swipe is not None:
-                go_on = before_swipe()
-                if not go_on:
-                    return
-            _set_debug_event('api_start',
-                             data={'api': 'swipe', 'action': '滑动(swipe)', 'status': '执行中...', 'has_sub_event': False})
-            _swipe(v, v2=v2, device=device, **kwargs)
-            sleep(interval)
-            _set_debug_event('api_end', data={'api': 'swipe', 'status': '完成'})
-            swipe_count += 1
-            if after_swipe is not None:
-                go_on = after_swipe()
-                if not go_on:
-                    return
+                else:
+                    future = executor.submit(search.process, screen, swipe_v2)
+                    if pending is not None:
+                        new_items, is_end, offset = pending[0].result()
+                        search.adapt(offset, pending[1])
+                        pending = None
+                        if is_end is None or not search.deliver(new_items) or is_end:
+                            future.cancel()
+                            return
+                    pending = (future, screen)
+                if before_swipe is not None:
+                    go_on = before_swipe()
+                    if not go_on:
+                        break
+                _set_debug_event('api_start',
+                                 data={'api': 'swipe', 'action': '滑动(swipe)', 'status': '执行中...',
+                                       'has_sub_event': False})
+                swipe_v2 = search.v2
+                _swipe(v, v2=swipe_v2, device=device, **kwargs)
+                sleep(interval)
+                _set_debug_event('api_end', data={'api': 'swipe', 'status': '完成'})
+                swipe_count += 1
+                if after_swipe is not None:
+                    go_on = after_swipe()
+                    if not go_on:
+                        break
+            if pending is not None:
+                # 回调尚未处理的最后一帧
+                new_items, is_end, _ = pending[0].result()
+                if is_end is not None:
+                    search.deliver(new_items)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
     else:
         _set_debug_event('api_start',
                          data={'api': 'swipe', 'action': '滑动(swipe)', 'status': '执行中...', 'has_sub_event': False})
@@ -452,7 +590,7 @@ def _convert_swipe_v(v, device=None):
     return v
 
 
-def exists(v, device=None, in_rect=None, timeout=None, threshold=None, interval=0.5, intervalfunc=None):
+def exists(v, device=None, in_rect=None, timeout=None, threshold=None, interval=0.5, intervalfunc=None, poll=None):
     """
     检查给定的目标是否在屏幕上存在，如果不存在会一直等到超时为止
 
@@ -462,6 +600,7 @@ def exists(v, device=None, in_rect=None, timeout=None, threshold=None, interval=
     :param interval: 尝试匹配图像的时间间隔，单位秒，默认：0.5
     :param intervalfunc: 匹配成功后的回调函数，默认:None
     :param threshold: 图像匹配的信度阈值
+    :param poll: 轮询策略，PollStrategy实例，设置后忽略interval，默认：None，即按interval固定间隔轮询
     :param in_rect: 在指定区域内匹配，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，
                     默认：None
     :return: 匹配信息，包括坐标、信度等
@@ -484,7 +623,7 @@ def exists(v, device=None, in_rect=None, timeout=None, threshold=None, interval=
                          data={'api': 'exists', 'action': '判断是否存在(exists)', 'status': '执行中...', 'has_sub_event': True})
         timeout = timeout or ST.FIND_TIMEOUT
         match_info = loop_find_best(v, device=device, in_rect=in_rect, timeout=timeout, threshold=threshold,
-                                    interval=interval, intervalfunc=intervalfunc)
+                                    interval=interval, intervalfunc=intervalfunc, poll=poll)
     except TargetNotFoundError:
         _set_debug_event('api_end', data={'api': 'exists', 'status': '不存在'})
         return False
@@ -494,7 +633,7 @@ def exists(v, device=None, in_rect=None, timeout=None, threshold=None, interval=
 
 
 def loop_find_best(query, device=None, in_rect=None, timeout=ST.FIND_TIMEOUT, threshold=None, interval=0.5,
-                   intervalfunc=None):
+                   intervalfunc=None, poll=None):
     """
     Search for image template in the screen until timeout
 
@@ -505,6 +644,7 @@ def loop_find_best(query, device=None, in_rect=None, timeout=ST.FIND_TIMEOUT, th
         threshold: default is None
         interval: sleep interval before next attempt to find the image template
         intervalfunc: function that is executed after unsuccessful attempt to find the image template
+        poll: polling strategy (PollStrategy instance), overrides interval when set
 
     Raises:
         TargetNotFoundError: when image template is not found in screenshot
@@ -515,70 +655,582 @@ def loop_find_best(query, device=None, in_rect=None, timeout=ST.FIND_TIMEOUT, th
 
     """
     G.LOGGING.info("Try finding: %s", query)
+    poll = poll or FixedPoll(interval)
+    intervals = poll.intervals(query)
     start_time = time.time()
+    skipper = _MatchSkipper()
     while True:
-        match_info = find_best_in_screen(query, device=device, in_rect=in_rect, threshold=threshold)
+        screen = get_screen(device=device)
+        if screen is None:
+            G.LOGGING.warning("Screen is None, may be locked")
+            match_info = False
+        else:
+            # 匹配区域与上次匹配失败时相同，则跳过本次匹配
+            fingerprint = get_screen_fingerprint(screen, in_rect=in_rect)
+            if skipper.should_skip(fingerprint):
+                match_info = False
+            else:
+                match_info = find_best_in_screen(query, device=device, screen=screen, in_rect=in_rect,
+                                                 threshold=threshold)
+                skipper.on_matched(fingerprint)
         if match_info:
+            poll.on_found(query, time.time() - start_time)
             return match_info
 
         if intervalfunc is not None:
             intervalfunc()
 
         # 超时则raise，未超时则进行下次循环:
-        if (time.time() - start_time) > timeout:
+        elapsed = time.time() - start_time
+        if elapsed > timeout:
             raise TargetNotFoundError('Picture %s not found in screen' % query)
         else:
-            time.sleep(interval)
+            time.sleep(min(next(intervals), timeout - elapsed))
+
+
+def get_screen_fingerprint(screen, in_rect=None, size=(32, 32)):
+    """
+    计算屏幕（或指定区域）的指纹，用于快速判断屏幕内容是否发生变化
+
+    :param screen: 屏幕截图
+    :param in_rect: 指定区域，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，
+                    默认：None
+    :param size: 计算指纹前缩小到的尺寸，默认：(32, 32)
+    :return: 指纹，屏幕内容相同时指纹相同
+    """
+    thumbnail = get_screen_thumbnail(screen, in_rect=in_rect, size=size)
+    return thumbnail.tobytes() if thumbnail is not None else None
+
+
+class _MatchSkipper:
+    """
+    判断屏幕（或区域）的指纹与上次完整匹配时是否相同，相同则可以跳过本次匹配。
+    缩略图会把细小的变化（如角标、按钮出现）平均掉，因此连续跳过max_skip_count次，
+    或距上次完整匹配超过max_skip_time秒后，即使指纹相同也要完整匹配一次
+    """
+
+    def __init__(self, max_skip_count=3, max_skip_time=1.0):
+        self._max_skip_count = max_skip_count
+        self._max_skip_time = max_skip_time
+        self._fingerprint = None
+        self._skip_count = 0
+        self._match_time = 0
+
+    def should_skip(self, fingerprint):
+        if fingerprint is None or fingerprint != self._fingerprint or self._skip_count >= self._max_skip_count \
+                or time.time() - self._match_time >= self._max_skip_time:
+            return False
+        self._skip_count += 1
+        return True
+
+    def on_matched(self, fingerprint):
+        self._fingerprint = fingerprint
+        self._skip_count = 0
+        self._match_time = time.time()
+
+
+def get_screen_thumbnail(screen, in_rect=None, size=(32, 32)):
+    """
+    获取屏幕（或指定区域）的缩略图
+
+    :param screen: 屏幕截图
+    :param in_rect: 指定区域，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，
+                    默认：None
+    :param size: 缩略图尺寸，默认：(32, 32)
+    :return: 缩略图，区域为空时返回None
+    """
+    img = crop_screen(screen, in_rect) if in_rect is not None else screen
+    if img.size == 0:
+        return None
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+class ScreenStableChecker:
+    """
+    逐帧检查屏幕是否稳定（连续帧之间没有明显变化）
+    """
+
+    def __init__(self, in_rect=None, stable_time=0.3, max_diff=2.0):
+        """
+        :param in_rect: 只检查指定区域，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，
+                        默认：None
+        :param stable_time: 屏幕需要保持不变的时间，单位秒，默认：0.3
+        :param max_diff: 两帧缩略图的平均像素差小于该值时视为没有变化，默认：2.0
+        """
+        self._in_rect = in_rect
+        self._stable_time = stable_time
+        self._max_diff = max_diff
+        self._last_thumbnail = None
+        self._stable_since = None
+        self._changed = True
+
+    @property
+    def changed(self):
+        """
+        最近一帧与上一帧相比是否有变化，第一帧及无法截屏时视为有变化
+        """
+        return self._changed
+
+    def update(self, screen, now=None):
+        """
+        加入一帧
+
+        :param screen: 屏幕截图，为None时视为有变化
+        :param now: 截屏时间，默认：None，即当前时间
+        :return: 屏幕是否已稳定
+        """
+        now = time.time() if now is None else now
+        thumbnail = get_screen_thumbnail(screen, in_rect=self._in_rect) if screen is not None else None
+        self._changed = thumbnail is None or self._last_thumbnail is None or \
+            cv2.absdiff(thumbnail, self._last_thumbnail).mean() >= self._max_diff
+        self._last_thumbnail = thumbnail
+        if self._changed:
+            self._stable_since = None
+            return False
+        self._stable_since = self._stable_since or now
+        return now - self._stable_since >= self._stable_time
+
+
+def wait_screen_stable(device=None, in_rect=None, timeout=3, min_wait=0.2, stable_time=0.3, interval=0.1,
+                       max_diff=2.0):
+    """
+    等待屏幕稳定（连续帧之间没有明显变化），直到超时为止，用于替代操作后的固定等待
+
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :param in_rect: 只检查指定区域，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，
+                    默认：None
+    :param timeout: 最长等待时间，单位秒，默认：3
+    :param min_wait: 最短等待时间，避免界面尚未开始变化就判定为稳定，单位秒，默认：0.2
+    :param stable_time: 屏幕需要保持不变的时间，单位秒，默认：0.3
+    :param interval: 截屏间隔，单位秒，默认：0.1
+    :param max_diff: 两帧缩略图的平均像素差小于该值时视为没有变化，默认：2.0
+    :return: 屏幕是否已稳定，超时返回False
+    """
+    start_time = time.time()
+    checker = ScreenStableChecker(in_rect=in_rect, stable_time=stable_time, max_diff=max_diff)
+    time.sleep(min(min_wait, timeout))
+    while True:
+        screen = get_screen(device=device)
+        now = time.time()
+        if checker.update(screen, now):
+            return True
+        if now - start_time >= timeout:
+            return False
+        time.sleep(min(interval, max(timeout - (now - start_time), 0)))
+
+
+def crop_screen(screen, in_rect):
+    """
+    截取屏幕的指定区域
+
+    :param screen: 屏幕截图
+    :param in_rect: 指定区域，采用屏幕相对坐标 ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间
+    :return: 区域图像
+    """
+    pos_left_top = (int(in_rect[0][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
+                    int(in_rect[0][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
+    pos_right_bottom = (int(in_rect[1][0] * screen.shape[1] / 2 + screen.shape[1] / 2),
+                        int(in_rect[1][1] * screen.shape[0] / 2 + screen.shape[0] / 2))
+    return screen[pos_left_top[1]: pos_right_bottom[1], pos_left_top[0]: pos_right_bottom[0]]
+
+
+def estimate_scroll_offset(prev_screen, screen, in_rect=None, expected=None, scale=0.5, min_response=0.05):
+    """
+    用相位相关估计两帧之间内容的滚动位移
+
+    :param prev_screen: 前一帧屏幕截图
+    :param screen: 当前屏幕截图
+    :param in_rect: 只在指定区域内估计（如列表区域，避免固定的标题栏、底栏干扰），采用屏幕相对坐标
+                    ((left, top), (bottom, right))。相对坐标从上至下、从左至右对应-1~1区间，默认：None
+    :param expected: 预期的位移 (dx, dy)，用于消除位移超过区域一半时的歧义，默认：None
+    :param scale: 估计前的缩放比例，默认：0.5
+    :param min_response: 相关峰值的最小值，低于该值时视为无法估计，默认：0.05
+    :return: 内容的位移 (dx, dy)，单位为屏幕像素，内容向下（右）移动时为正；无法估计时返回None
+    """
+    prev_img = _get_correlate_image(prev_screen, in_rect, scale)
+    img = _get_correlate_image(screen, in_rect, scale)
+    if prev_img is None or img is None or prev_img.shape != img.shape:
+        return None
+    window = cv2.createHanningWindow((img.shape[1], img.shape[0]), cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(prev_img, img, window)
+    if response < min_response:
+        return None
+    dx, dy = dx / scale, dy / scale
+    if expected is not None:
+        # 相位相关得到的是以区域大小为周期的位移，取最接近预期的一个
+        width, height = img.shape[1] / scale, img.shape[0] / scale
+        dx = min((dx, dx - width, dx + width), key=lambda x: math.fabs(x - expected[0]))
+        dy = min((dy, dy - height, dy + height), key=lambda y: math.fabs(y - expected[1]))
+    return dx, dy
+
+
+def _get_correlate_image(screen, in_rect, scale):
+    img = crop_screen(screen, in_rect) if in_rect is not None else screen
+    if img is None or img.size == 0:
+        return None
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if scale != 1:
+        img = cv2.resize(img, (max(int(img.shape[1] * scale), 1), max(int(img.shape[0] * scale), 1)),
+                         interpolation=cv2.INTER_AREA)
+    return img.astype('float32')
+
+
+class _SwipeSearch:
+    """
+    滑动搜索模式下的逐帧处理：估计滚动位移、匹配、消重及回调。各帧必须按截屏顺序处理；
+    流水线模式下process在工作线程中执行，adapt、deliver及v2只在滑动线程中使用
+    """
+
+    def __init__(self, v, v2, device=None, search_f=None, bottom_f=None, search_in_rect=None, on_result=None,
+                 max_error_rate=None, max_hit_count=0, min_confidence=0.95, stop_when_still=True, adaptive_swipe=False,
+                 stitch_mode=False, **kwargs):
+        self._v = v
+        self._v2 = v2
+        # 调整前的滑动终点，位移无法估计时恢复为该终点
+        self._base_v2 = v2
+        self._device = device
+        self._search_f = search_f
+        self._bottom_f = bottom_f
+        self._search_in_rect = search_in_rect
+        self._on_result = on_result
+        self._max_error_rate = max_error_rate
+        self._max_hit_count = max_hit_count
+        self._min_confidence = min_confidence
+        self._stop_when_still = stop_when_still
+        self._adaptive_swipe = adaptive_swipe
+        self._stitch_mode = stitch_mode
+        self._kwargs = kwargs
+        self._hit_count = 0
+        self._swipe_vector = (v2[0] - v[0], v2[1] - v[1])
+        # 累计滚动位移，内容坐标 = 屏幕坐标 - 累计滚动位移
+        self._scroll_offset = (0, 0)
+        self._seen_index = _PosIndex()
+        self._last_screen = None
+        self._still_count = 0
+        # 拼接模式下已匹配过的区域底部（画布坐标），以及本帧的滚动位移是否是估计出来的
+        self._revealed_bottom = None
+        self._offset_measured = False
+
+    @property
+    def v2(self):
+        """
+        滑动终点，开启adaptive_swipe时会随实际移动距离调整
+        """
+        return self._v2
+
+    def process(self, screen, v2):
+        """
+        处理一帧
+
+        :param screen: 屏幕截图
+        :param v2: 得到该帧的那次滑动所用的终点
+        :return: (新的匹配结果数组, 是否已到底部, 估计出的滚动位移)，列表已不再移动时为 ([], None, (0, 0))。
+                 第一帧及列表没有移动时滚动位移为 (0, 0)，无法估计时为None
+        """
+        _set_debug_event('api_start',
+                         data={'api': 'swipe', 'action': '滑动匹配(swipe)', 'status': '执行中...', 'has_sub_event': True})
+        in_rect = self._search_in_rect
+        self._swipe_vector = (v2[0] - self._v[0], v2[1] - self._v[1])
+        measured_offset = (0, 0)
+        if self._last_screen is not None:
+            if self._stop_when_still and _is_screen_still(self._last_screen, screen, in_rect=in_rect):
+                self._still_count += 1
+                if self._still_count >= 2:
+                    _set_debug_event('api_end', data={'api': 'swipe', 'status': '列表已不再移动'})
+                    return [], None, measured_offset
+                offset = (0, 0)
+            else:
+                self._still_count = 0
+                # 按实际的滚动位移（含惯性滚动）换算内容坐标，无法估计时按滑动向量计算
+                measured_offset = estimate_scroll_offset(self._last_screen, screen, in_rect=in_rect,
+                                                         expected=self._swipe_vector)
+                self._offset_measured = measured_offset is not None
+                offset = measured_offset or self._swipe_vector
+            self._scroll_offset = (self._scroll_offset[0] + offset[0], self._scroll_offset[1] + offset[1])
+        self._last_screen = screen
+
+        match_rect = in_rect
+        has_new_region = True
+        if self._stitch_mode and self._revealed_bottom is not None:
+            # 位移无法估计时无法确定新区域，退化为匹配整个区域
+            if self._offset_measured or self._still_count > 0:
+                # 向上多留特征图的高度（及取整误差），保证跨越边界的特征完整出现在匹配区域中
+                margin = max(_get_feature_height(f, screen) for f in (self._search_f, self._bottom_f)
+                             if f is not None)
+                top = self._revealed_bottom + self._scroll_offset[1] - margin - 2
+                match_rect = _get_strip_rect(screen, in_rect, top)
+                has_new_region = match_rect is not None
+        if self._stitch_mode:
+            self._revealed_bottom = _get_rect_bottom(screen, in_rect) - self._scroll_offset[1]
+        if not has_new_region:
+            pos_info = None
+            bottom_pos_info = None if self._bottom_f is None else []
+        else:
+            pos_info = find_all_in_screen(self._search_f, device=self._device, screen=screen, in_rect=match_rect,
+                                          threshold=self._min_confidence)['results']
+            bottom_pos_info = None if self._bottom_f is None else \
+                find_all_in_screen(self._bottom_f, device=self._device, screen=screen, in_rect=match_rect,
+                                   threshold=self._min_confidence)['results']
+        new_items = _get_new_item(pos_info, self._seen_index, bottom_pos_info, self._scroll_offset,
+                                  self._swipe_vector[1], max_error_rate=self._max_error_rate)
+        _set_debug_event('api_end', data={'api': 'swipe', 'status': f'结果:{len(new_items)}'})
+        return new_items, bottom_pos_info is not None and len(bottom_pos_info) > 0, measured_offset
+
+    def adapt(self, offset, screen):
+        """
+        开启adaptive_swipe时，按process估计出的滚动位移调整之后滑动所用的终点
+
+        :param offset: process返回的滚动位移
+        :param screen: 对应帧的屏幕截图
+        :return: 无
+        """
+        if self._adaptive_swipe:
+            self._v2 = _get_adaptive_swipe_end(self._v, self._v2, offset, screen, in_rect=self._search_in_rect,
+                                               base_v2=self._base_v2)
+
+    def deliver(self, new_items):
+        """
+        回调匹配结果
+
+        :param new_items: 新的匹配结果数组
+        :return: 是否继续搜索
+        """
+        if self._on_result is not None:
+            for item in new_items:
+                if self._max_hit_count == 0 or self._hit_count < self._max_hit_count:
+                    go_on = self._on_result(item, **self._kwargs)
+                    if not go_on:
+                        return False
+                self._hit_count += 1
+                if 0 < self._max_hit_count <= self._hit_count:
+                    return False
+        return True
+
+
+def _is_screen_still(prev_screen, screen, in_rect=None, max_diff=2.0):
+    # 两帧缩略图的平均像素差小于max_diff时视为没有移动
+    prev_thumbnail = get_screen_thumbnail(prev_screen, in_rect=in_rect)
+    thumbnail = get_screen_thumbnail(screen, in_rect=in_rect)
+    return prev_thumbnail is not None and thumbnail is not None and \
+        cv2.absdiff(prev_thumbnail, thumbnail).mean() < max_diff
+
+
+def _get_adaptive_swipe_end(v, v2, offset, screen, in_rect=None, base_v2=None, min_move_rate=0.5,
+                            max_move_rate=0.9, target_move_rate=0.8, max_scale=2.0, min_scale=0.5):
+    """
+    按实际移动距离调整滑动终点：移动距离不足区域高度的min_move_rate时按比例加长滑动向量（每次最多max_scale倍），
+    超过区域高度的max_move_rate时按比例缩短（每次最多缩短到min_scale倍，避免两帧没有重叠而漏掉或无法消重），
+    使下次移动接近区域高度的target_move_rate，终点不超出屏幕。移动距离无法估计时恢复为base_v2
+    """
+    if offset is None:
+        return v2 if base_v2 is None else base_v2
+    screen_height = screen.shape[0]
+    region_height = screen_height * (in_rect[1][1] - in_rect[0][1]) / 2 if in_rect is not None else screen_height
+    moved = math.fabs(offset[1])
+    if moved == 0 or region_height * min_move_rate <= moved <= region_height * max_move_rate:
+        return v2
+    scale = min(max(region_height * target_move_rate / moved, min_scale), max_scale)
+    end_y = min(max(v[1] + (v2[1] - v[1]) * scale, 1), screen_height - 1)
+    return v2[0], end_y
+
+
+def _get_feature_height(v, screen):
+    return v.get_resized_size(screen)[0] if isinstance(v, Template) else 0
+
+
+def _get_rect_bottom(screen, in_rect):
+    # 区域底部的屏幕纵坐标（像素）
+    return int(in_rect[1][1] * screen.shape[0] / 2 + screen.shape[0] / 2) if in_rect is not None else screen.shape[0]
+
+
+def _get_strip_rect(screen, in_rect, top):
+    """
+    获取区域中从top（屏幕纵坐标，像素）到区域底部的部分，采用屏幕相对坐标，没有剩余部分时返回None
+    """
+    left, right = (in_rect[0][0], in_rect[1][0]) if in_rect is not None else (-1, 1)
+    region_top = in_rect[0][1] if in_rect is not None else -1
+    region_bottom = in_rect[1][1] if in_rect is not None else 1
+    strip_top = max(top * 2 / screen.shape[0] - 1, region_top)
+    if strip_top >= region_bottom:
+        return None
+    return (left, strip_top), (right, region_bottom)
+
+
+class _PosIndex:
+    """
+    按网格划分的位置索引，在内容坐标中查找已处理过的位置，每次查找只检查附近的网格
+    """
+
+    def __init__(self, cell_size=50):
+        self._cell_size = cell_size
+        self._cells = {}
+
+    def add(self, pos):
+        key = (int(pos[0] // self._cell_size), int(pos[1] // self._cell_size))
+        self._cells.setdefault(key, []).append(pos)
+
+    def contains(self, pos, tolerance):
+        for cx in range(int((pos[0] - tolerance) // self._cell_size), int((pos[0] + tolerance) // self._cell_size) + 1):
+            for cy in range(int((pos[1] - tolerance) // self._cell_size),
+                            int((pos[1] + tolerance) // self._cell_size) + 1):
+                for p in self._cells.get((cx, cy), ()):
+                    if math.fabs(p[0] - pos[0]) <= tolerance and math.fabs(p[1] - pos[1]) <= tolerance:
+                        return True
+        return False
 
 
 def find_best_in_screen(query, device=None, screen=None, in_rect=None, threshold=None):
     global _lock
     if screen is None:
-        dev = device if device else G.DEVICE
-        screen = dev.snapshot(filename=None, quality=ST.SNAPSHOT_QUALITY)
+        screen = get_screen(device=device)
         if screen is None:
             G.LOGGING.warning("Screen is None, may be locked")
             return False
+    return _find_best_in_screen(query, device=device, screen=screen, in_rect=in_rect, threshold=threshold,
+                                executor=_get_match_executor(device))
 
+
+def _find_best_in_screen(query, device=None, screen=None, in_rect=None, threshold=None, executor=None):
     if isinstance(query, list):
-        for v in query:
-            match_info = find_best_in_screen(v, device=device, in_rect=in_rect, screen=screen, threshold=threshold)
+        match_infos = _iter_best_in_screen(query, device=device, screen=screen, in_rect=in_rect,
+                                           threshold=threshold, executor=executor)
+        for match_info in match_infos:
             if match_info:
+                match_infos.close()
                 return match_info
         return False
     elif isinstance(query, tuple):
         ret = {"items": []}
-        for v in query:
-            match_info = find_best_in_screen(v, device=device, in_rect=in_rect, screen=screen, threshold=threshold)
+        match_infos = _iter_best_in_screen(query, device=device, screen=screen, in_rect=in_rect,
+                                           threshold=threshold, executor=executor)
+        for match_info in match_infos:
             if match_info:
+                match_infos.close()
                 return False
             else:
                 ret['items'].append(match_info)
         return ret
     else:
-        if threshold:
-            query.threshold = threshold
-        ret = query.match_best_in(screen, in_rect=in_rect)
+        ret = query.match_best_in(screen, in_rect=in_rect, threshold=threshold)
         _set_debug_event('match_best_in', data=ret)
         return ret if ret['results'] is not None else False
 
 
+def _iter_best_in_screen(query, device=None, screen=None, in_rect=None, threshold=None, executor=None):
+    """
+    按原顺序逐个返回数组/元组中各特征图的匹配结果，有线程池时各特征图并行匹配
+    """
+    if executor is None or len(query) < 2:
+        for v in query:
+            yield _find_best_in_screen(v, device=device, screen=screen, in_rect=in_rect, threshold=threshold)
+        return
+
+    # 子项在工作线程中串行匹配，避免嵌套提交任务导致线程池死锁
+    futures = [executor.submit(_find_best_in_screen, v, device=device, screen=screen, in_rect=in_rect,
+                               threshold=threshold) for v in query]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # 已得到结果后，取消尚未开始的匹配任务
+        for future in futures:
+            future.cancel()
+
+
 def find_all_in_screen(v, device=None, screen=None, in_rect=None, threshold=None):
     if screen is None:
-        dev = device if device else G.DEVICE
-        screen = dev.snapshot(filename=None, quality=ST.SNAPSHOT_QUALITY)
+        screen = get_screen(device=device)
         if screen is None:
             G.LOGGING.warning("Screen is None, may be locked")
             return False
 
-    if threshold:
-        v.threshold = threshold
-    ret = v.match_all_in(screen, in_rect=in_rect)
+    ret = v.match_all_in(screen, in_rect=in_rect, threshold=threshold)
     _set_debug_event('match_all_in', data=ret)
     return ret
 
 
-def wait(v, device=None, in_rect=None, timeout=None, threshold=None, interval=0.5, intervalfunc=None):
+def find_features_in_screen(features, device=None, screen=None, in_rects=None, threshold=None):
+    """
+    截取一次屏幕，在同一张截图上批量匹配多个命名特征
+
+    :param features: 特征字典 {名称: 特征图}，特征图支持Template实例或数组；也可以是Feature实例数组
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :param screen: 屏幕截图，如果为None则自动截屏，默认:None
+    :param in_rects: 各特征的匹配区域字典 {名称: in_rect}，采用屏幕相对坐标，仅在features为字典时使用，默认:None
+    :param threshold: 图像匹配的信度阈值，也可以是各特征的阈值字典 {名称: 阈值}，字典中没有的特征按其自身的阈值匹配
+    :return: 匹配结果字典 {名称: 匹配信息}，未匹配到的特征对应False
+    :Example:
+        >>> infos = find_features_in_screen({'首页': Template(r"tpl1.png"), '弹窗': Template(r"tpl2.png")})
+        >>> if infos['弹窗']:
+        >>>     touch(infos['弹窗']['pos'])
+    """
+    items = _get_feature_items(features, in_rects=in_rects)
+    if screen is None:
+        screen = get_screen(device=device)
+        if screen is None:
+            G.LOGGING.warning("Screen is None, may be locked")
+            return {name: False for name, _, _ in items}
+
+    results = {}
+    for name, v, in_rect in items:
+        v_threshold = threshold.get(name) if isinstance(threshold, dict) else threshold
+        results[name] = find_best_in_screen(v, device=device, screen=screen, in_rect=in_rect,
+                                            threshold=v_threshold) if v is not None else False
+    return results
+
+
+def exists_features(features, device=None, in_rects=None, timeout=None, threshold=None, interval=0.5, poll=None):
+    """
+    检查多个命名特征，每次尝试只截屏一次，直到任一特征出现或超时为止
+
+    :param features: 特征字典 {名称: 特征图}，特征图支持Template实例或数组；也可以是Feature实例数组
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :param in_rects: 各特征的匹配区域字典 {名称: in_rect}，采用屏幕相对坐标，仅在features为字典时使用，默认:None
+    :param timeout: 等待匹配图像的超时时间，默认：None（内部是20秒)
+    :param threshold: 图像匹配的信度阈值，也可以是各特征的阈值字典 {名称: 阈值}，字典中没有的特征按其自身的阈值匹配
+    :param interval: 尝试匹配图像的时间间隔，单位秒，默认：0.5
+    :param poll: 轮询策略，PollStrategy实例，设置后忽略interval，默认：None，即按interval固定间隔轮询
+    :return: 最后一次匹配的结果字典 {名称: 匹配信息}，未匹配到的特征对应False
+    """
+    _set_debug_event('api_start',
+                     data={'api': 'exists', 'action': '批量判断是否存在(exists_features)', 'status': '执行中...',
+                           'has_sub_event': True})
+    timeout = ST.FIND_TIMEOUT if timeout is None else timeout
+    poll = poll or FixedPoll(interval)
+    intervals = poll.intervals(features)
+    start_time = time.time()
+    skipper = _MatchSkipper()
+    results = None
+    while True:
+        screen = get_screen(device=device)
+        fingerprint = get_screen_fingerprint(screen) if screen is not None else None
+        # 屏幕与上次匹配失败时相同，则跳过本次匹配
+        if results is None or not skipper.should_skip(fingerprint):
+            results = find_features_in_screen(features, device=device, screen=screen, in_rects=in_rects,
+                                              threshold=threshold)
+            skipper.on_matched(fingerprint)
+        hit_names = [name for name in results.keys() if results[name]]
+        elapsed = time.time() - start_time
+        if len(hit_names) > 0:
+            poll.on_found(features, elapsed)
+            break
+        elif elapsed > timeout:
+            break
+        time.sleep(min(next(intervals), timeout - elapsed))
+    _set_debug_event('api_end', data={'api': 'exists', 'status': f'存在:{",".join(hit_names)}' if hit_names else '不存在'})
+    return results
+
+
+def _get_feature_items(features, in_rects=None):
+    if isinstance(features, dict):
+        in_rects = in_rects or {}
+        return [(name, features[name], in_rects.get(name)) for name in features.keys()]
+    else:
+        return [(f.name, f.feature, f.in_rect) for f in features]
+
+
+def wait(v, device=None, in_rect=None, timeout=None, threshold=None, interval=0.5, intervalfunc=None, poll=None):
     """
     等待给定的目标出现在屏幕上，直到超时为止
 
@@ -590,18 +1242,20 @@ def wait(v, device=None, in_rect=None, timeout=None, threshold=None, interval=0.
     :param threshold: 图像匹配的信度阈值
     :param interval: 尝试匹配图像的时间间隔，单位秒，默认：0.5
     :param intervalfunc: 匹配成功后的回调函数，默认:None
+    :param poll: 轮询策略，PollStrategy实例，设置后忽略interval，默认：None，即按interval固定间隔轮询
     :return: 匹配信息，包括坐标、信度等
     """
     _set_debug_event('api_start', data={'api': 'wait', 'action': '等待(wait)', 'status': '执行中...', 'has_sub_event': True})
     ret = exists(v, device=device, in_rect=in_rect, timeout=timeout, threshold=threshold, interval=interval,
-                 intervalfunc=intervalfunc)
+                 intervalfunc=intervalfunc, poll=poll)
     _set_debug_event('api_end', data={'api': 'wait', 'status': ('成功' if ret else '超时')})
     if ret is None:
         dbg_pause()
     return ret
 
 
-def touch(v, device=None, in_rect=None, times=1, auto_back=False, action=None, timeout=ST.FIND_TIMEOUT, **kwargs):
+def touch(v, device=None, in_rect=None, times=1, auto_back=False, action=None, timeout=ST.FIND_TIMEOUT, poll=None,
+          **kwargs):
     """
     点击屏幕
 
@@ -613,6 +1267,7 @@ def touch(v, device=None, in_rect=None, times=1, auto_back=False, action=None, t
     :param auto_back: 是否自动返回（模拟点击回退键），默认：False
     :param action: 点击后的回调函数，默认：None
     :param timeout: 匹配锚点图片时的等待超时时间，当没有特征图时，则点击指定位置后，也会等待该超时时间
+    :param poll: 匹配锚点图片时的轮询策略，PollStrategy实例，默认：None，即按0.5秒固定间隔轮询
     :param **kwargs: 平台关键词`kwargs`, 用户可以附加额外参数，这些参数则会传递给锚点目标页面的脚本
     :return: 无
 
@@ -620,7 +1275,7 @@ def touch(v, device=None, in_rect=None, times=1, auto_back=False, action=None, t
     if isinstance(v, Template):
         _set_debug_event('api_start',
                          data={'api': 'touch', 'action': '点击(touch)', 'status': '执行中...', 'has_sub_event': True})
-        match_result = exists(v, device=device, in_rect=in_rect, timeout=timeout)
+        match_result = exists(v, device=device, in_rect=in_rect, timeout=timeout, poll=poll)
         pos = match_result['pos'] if match_result else None
     else:
         _set_debug_event('api_start',
@@ -680,6 +1335,7 @@ def text(text, device=None, enter=True, **kwargs):
     """
     dev = device if device else G.DEVICE
     dev.text(text, enter=enter, **kwargs)
+    _mark_action(device)
     delay_after_operation()
 
 
@@ -720,23 +1376,30 @@ def _touch(v, device=None, times=1, **kwargs):
     else:
         pos = v
     dev = device if device else G.DEVICE
-    for _ in range(times):
+    for i in range(times):
+        if i > 0:
+            time.sleep(0.05)
         dev.touch(pos, **kwargs)
-        time.sleep(0.05)
+    _mark_action(device)
     delay_after_operation()
     return pos
 
 
-def go_back(device=None, action=None):
+def go_back(device=None, action=None, timeout=1):
     """
     在手机模拟点击回退键
+
+    :param device: 设备对象，如果为None则使用airtest内部的全局设备，默认:None
+    :param action: 回退前的回调函数，默认：None
+    :param timeout: 回退后等待屏幕稳定的最长时间，单位秒，默认：1
+    :return: 无
     """
     if action is not None:
         action()
     _set_debug_event('api_start',
                      data={'api': 'go_back', 'action': '回退(go_back)', 'status': '执行中...', 'has_sub_event': False})
     _keyevent("BACK", device=device)
-    sleep(1)
+    wait_screen_stable(device=device, timeout=timeout)
     _set_debug_event('api_end', data={'api': 'go_back', 'status': '完成'})
 
 
@@ -787,6 +1450,7 @@ def _keyevent(keyname, device=None, **kwargs):
     """
     dev = device if device else G.DEVICE
     dev.keyevent(keyname, **kwargs)
+    _mark_action(device)
     delay_after_operation()
 
 
@@ -841,6 +1505,7 @@ def _swipe(v1, v2=None, vector=None, device=None, **kwargs):
 
     dev = device if device else G.DEVICE
     dev.swipe(pos1, pos2, **kwargs)
+    _mark_action(device)
     delay_after_operation()
     return pos1, pos2
 
@@ -1064,32 +1729,40 @@ def _get_col_name_for_write_excel(datas):
     return None
 
 
-def _get_new_item(pos_info, last_pos_info, bottom_pos_info, swipe_v, max_error_rate=None):
+def _get_new_item(pos_info, seen_index, bottom_pos_info, scroll_offset, swipe_v, max_error_rate=None):
+    """
+    筛选出未处理过的匹配结果，并将其加入索引。位置在内容坐标（屏幕坐标减去累计滚动位移）中比较
+    """
     results = []
     if pos_info is not None:
         for i in pos_info:
-            if not _is_pos_exists(i, last_pos_info, swipe_v, max_error_rate=max_error_rate):
-                if bottom_pos_info is None or len(bottom_pos_info) == 0 or i['result'][1] < \
-                        bottom_pos_info[0]['result'][1]:
-                    results.append(i)
+            if bottom_pos_info is not None and len(bottom_pos_info) > 0 and \
+                    i['result'][1] >= bottom_pos_info[0]['result'][1]:
+                continue
+            pos = (i['result'][0] - scroll_offset[0], i['result'][1] - scroll_offset[1])
+            if not seen_index.contains(pos, _get_dedup_tolerance(i, swipe_v, max_error_rate=max_error_rate)):
+                seen_index.add(pos)
+                i['canvas_result'] = pos
+                results.append(i)
     return results
 
 
-def _is_pos_exists(pos, pos_list, swipe_v=0, max_error_rate=None):
-    is_exists = False
-    if pos_list is not None:
-        max_error = math.fabs(swipe_v * (max_error_rate or 0.1))
-        for i in pos_list:
-            if math.fabs(i['result'][0] - pos['result'][0]) <= max_error and math.fabs(
-                    i['result'][1] + swipe_v - pos['result'][1]) <= max_error:
-                is_exists = True
-                break
-    return is_exists
+def _get_dedup_tolerance(pos, swipe_v, max_error_rate=None):
+    # 设置了误差率时沿用原来的按滑动距离计算的误差，否则取匹配区域较短边的一半（同一特征图的两个结果不会靠得更近）
+    rectangle = pos.get('rectangle')
+    if max_error_rate is None and rectangle:
+        xs = [p[0] for p in rectangle]
+        ys = [p[1] for p in rectangle]
+        return max(min(max(xs) - min(xs), max(ys) - min(ys)) / 2, 1)
+    return math.fabs(swipe_v * (max_error_rate or 0.1))
 
 
 def _set_debug_event(event, data=None):
+    # 没有注册调试器时（无界面运行）直接返回，不加锁也不采集调用栈
+    if not _debuggers:
+        return
     with _lock:
         if data and isinstance(data, dict):
-            data['stack'] = inspect.stack()
+            data['stack'] = DebugStack(skip=0)
         for key in _debuggers.keys():
             _debuggers[key].on_debug_event(event, data)
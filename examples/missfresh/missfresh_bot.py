@@ -43,7 +43,7 @@ class MissfreshBot(AirtestBot):
                     self._on_result_callback(datas)
                 if exists(Template(r"tpl1646706830703.png", record_pos=(-0.411, 0.704), resolution=(1080, 1920)),
                           timeout=20):
-                    sleep(5)
+                    wait_screen_stable(timeout=5)
                     swipe(Template(r"tpl1646721501254.png", resolution=(1080, 1920)), search_mode=True,
                           bottom_f=Template(r"tpl1646988721772.png", resolution=(1080, 1920)),
                           on_result=self._on_find_items, before_swipe=self._before_swipe_in_search_result,
@@ -63,7 +63,7 @@ class MissfreshBot(AirtestBot):
         # 订阅商品数据
         self._order_data({"product": r"https://as-vip.missfresh.cn/as/item/product/detail"})
         touch(touch_pos, auto_back=True, action=self._browse_item)
-        sleep(2)
+        wait_screen_stable(timeout=2)
         return True
 
     def _before_swipe_in_search_result(self):
@@ -81,7 +81,7 @@ class MissfreshBot(AirtestBot):
         # 订阅评论数据
         self._order_data({"comment": r"https://as-vip.missfresh.cn/as/item/detail/comment"})
         touch(item['result'], auto_back=True, action=self._browse_comment)
-        sleep(2)
+        wait_screen_stable(timeout=2)
         return False
 
     def _browse_comment(self):
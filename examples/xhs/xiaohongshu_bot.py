@@ -47,7 +47,7 @@ class XiaohongshuBot(AirtestBot):
                     self._on_result_callback(datas)
                 if exists(Template(r"tpl1647595726169.png", record_pos=(-0.266, -0.259), resolution=(1080, 1920)),
                           timeout=20):
-                    sleep(5)
+                    wait_screen_stable(timeout=5)
                     swipe((0, 0.5), v2=(0, -0.5), search_mode=True,
                           search_f=Template(r"tpl1647595756926.png", record_pos=(0.34, 0.106), resolution=(1080, 1920)),
                           search_in_rect=((-1.000, -0.819), (1.000, 0.875)), max_swipe_count=5,
@@ -71,11 +71,11 @@ class XiaohongshuBot(AirtestBot):
         # 订阅商品数据
         self._order_data(Filter("评论数据", r"https://edith.xiaohongshu.com/api/sns/v5/note/comment/list"))
         touch(touch_pos, auto_back=True, action=self._browse_item)
-        sleep(0.5)
+        wait_screen_stable(timeout=0.5)
         return True
 
     def _browse_item(self):
-        sleep(3)
+        wait_screen_stable(timeout=3)
         match_info = exists([Template(r"tpl1647595848608.png", record_pos=(0.38, 0.692), resolution=(1080, 1920)),
                              Template(r"tpl1647597359321.png", record_pos=(0.338, 0.696), resolution=(1080, 1920))],
                             in_rect=((-1.000, 0.713), (1.000, 0.844)), timeout=10)
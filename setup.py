@@ -22,7 +22,7 @@ setup(name = "airtest-ext",
           'resource/*.*'
       ],
     },
-    install_requires=['airtest', 'mitmproxy>=7.0.0', 'frida_hooks>=0.9.16', 'dearpygui>=1.5']
+    install_requires=['airtest', 'mitmproxy>=7.0.0,<8', 'frida_hooks>=0.9.16', 'dearpygui>=1.5']
 )
 
 
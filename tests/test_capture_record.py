@@ -0,0 +1,52 @@
+import gzip
+import os
+import pytest
+
+pytest.importorskip('mitmproxy')
+from mitmproxy import http
+from airtest_ext.capture_record import CaptureRecord
+
+
+def _make_response(body=b'{"items": [1, 2]}'):
+    response = http.Response.make(200)
+    response.raw_content = gzip.compress(body)
+    response.headers = http.Headers([(b'Content-Type', b'application/json'), (b'Content-Encoding', b'gzip')])
+    return response
+
+
+def test_record_decodes_lazily_from_snapshot():
+    response = _make_response()
+    record = CaptureRecord('feed', 'https://a.com/x', 'GET', request=None, response=response)
+    response.raw_content = b'changed after the hook returned'
+    assert record.data_size == len(gzip.compress(b'{"items": [1, 2]}'))
+    assert record['data'] == '{"items": [1, 2]}'
+    assert record.get_json() == {'items': [1, 2]}
+    assert record['post_data'] is None
+    assert dict(record) == {'data_name': 'feed', 'url': 'https://a.com/x', 'method': 'GET', 'post_data': None,
+                            'data': '{"items": [1, 2]}'}
+
+
+def test_too_large_body_is_not_kept():
+    record = CaptureRecord('feed', 'https://a.com/x', 'GET', response=_make_response(), max_body_size=10)
+    assert record.too_large
+    assert record['data'] is None
+
+
+def _spill_files(path):
+    return [name for name in os.listdir(path) if name.startswith('airtest_body_')]
+
+
+def test_spilled_body_is_read_back_and_removed(tmp_path):
+    record = CaptureRecord('feed', 'https://a.com/x', 'GET', response=_make_response(), spill_size=10,
+                           spill_dir=str(tmp_path))
+    assert len(_spill_files(tmp_path)) == 1
+    assert record['data'] == '{"items": [1, 2]}'
+    assert _spill_files(tmp_path) == []
+
+
+def test_close_removes_spill_file(tmp_path):
+    with CaptureRecord('feed', 'https://a.com/x', 'GET', response=_make_response(), spill_size=10,
+                       spill_dir=str(tmp_path)) as record:
+        assert len(_spill_files(tmp_path)) == 1
+    assert _spill_files(tmp_path) == []
+    assert record['data'] is None
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+import pytest
+
+pytest.importorskip('jsonpath')
+from airtest_ext.data_filter import Filter, FilterMatcher, get_host_regexes
+
+
+URLS = [
+    'https://edith.xiaohongshu.com/api/sns/v6/homefeed?cursor=1',
+    'https://EDITH.xiaohongshu.com/api/sns/v1/note/feed',
+    'https://www.xiaohongshu.com/explore/abc',
+    'http://cdn.example.com/img/1.png',
+    'https://api.example.com/v2/user/info?id=3',
+    'https://api.example.com/v2/user\ninfo',
+    'https://other.com/',
+]
+
+
+def _match_per_filter(filters, url):
+    for f in filters:
+        if f.pattern.search(url) is not None:
+            return f
+    return None
+
+
+@pytest.mark.parametrize('regexes', [
+    [r'/api/sns/v6/homefeed', r'/api/sns/v\d/note', r'^https://www\.xiaohongshu\.com/'],
+    [r'user.info', r'^https?://api\.example\.com/v2/user', r'\.png$'],
+    [r'homefeed|note/feed', r'(explore)/\w+', r'HTTP://CDN'],
+    # 反向引用无法合并，退化为逐个匹配
+    [r'(api)\.example\.com/v2/\w+', r'(\w)\1', r'other'],
+])
+def test_filter_matcher_matches_like_per_filter(regexes):
+    filters = [Filter(f'data{i}', regex) for i, regex in enumerate(regexes)]
+    matcher = FilterMatcher(filters)
+    for url in URLS:
+        assert matcher.match(url) is _match_per_filter(filters, url), url
+
+
+def test_filter_matcher_without_filters():
+    matcher = FilterMatcher([])
+    assert matcher.match(URLS[0]) is None
+    assert matcher.allow_hosts == []
+
+
+@pytest.mark.parametrize('regex, hosts', [
+    (r'https://edith\.xiaohongshu\.com/api/sns/v6/homefeed', ['edith.xiaohongshu.com']),
+    (r'^https?://API.example.com:8443/v2', ['api.example.com']),
+    (r'https://a\.com/x|https://b\.com/y|https://a\.com/z', ['a.com', 'b.com']),
+    (r'https://a\.com/(x|y)|https://b\.com$', ['a.com', 'b.com']),
+    (r'https://a\.com/[|]|https://b\.com/', ['a.com', 'b.com']),
+    (r'https://a\.com/x|/api/feed', None),
+    (r'/api/sns/v6/homefeed', None),
+])
+def test_filter_hosts(regex, hosts):
+    assert Filter('data', regex).hosts == hosts
+
+
+def test_filter_matcher_allow_hosts():
+    filters = [Filter('a', r'https://a\.com/x|https://b\.com/y'), Filter('b', r'https://a\.com/z')]
+    allow_hosts = FilterMatcher(filters).allow_hosts
+    assert allow_hosts == get_host_regexes(['a.com', 'b.com'])
+    assert re.match(allow_hosts[0], 'a.com:443') and not re.match(allow_hosts[0], 'xa.com')
+    assert FilterMatcher(filters + [Filter('c', r'/feed')]).allow_hosts is None
+
+
+@pytest.mark.parametrize('regex', [r'https://api\.foo\.com', r'^https://api\.foo\.com/', r'https://api\.foo\.com:8443'])
+def test_allow_hosts_match_whole_host(regex):
+    allow_hosts = FilterMatcher([Filter('a', regex), Filter('b', r'https://b\.com/')]).allow_hosts
+    for host in ('api.foo.com', 'API.foo.com', 'api.foo.com:443'):
+        assert any(re.search(rex, host, re.IGNORECASE) for rex in allow_hosts), host
+    for host in ('api.foo.com.evil.net', 'xapi.foo.com', 'api.foo.com:443x', 'api.foo.comb'):
+        assert not any(re.search(rex, host, re.IGNORECASE) for rex in allow_hosts), host
+
+
+def test_overflow_drop_oldest():
+    f = Filter('data', 'x', max_count=2, overflow_policy=Filter.DROP_OLDEST)
+    for i in range(4):
+        f.put(i)
+    assert f.drain() == [2, 3]
+    assert f.dropped_count == 2
+
+
+def test_overflow_drop_newest():
+    f = Filter('data', 'x', max_count=2, overflow_policy=Filter.DROP_NEWEST)
+    for i in range(4):
+        f.put(i)
+    assert f.drain() == [0, 1]
+    assert f.dropped_count == 2
+
+
+def test_overflow_block_waits_for_space():
+    f = Filter('data', 'x', max_count=1, overflow_policy=Filter.BLOCK, block_timeout=5)
+    f.put(0)
+    timer = threading.Timer(0.2, f.get_many)
+    timer.start()
+    start_time = time.time()
+    f.put(1)
+    assert 0.1 < time.time() - start_time < 5
+    assert f.drain() == [1]
+    assert f.dropped_count == 0
+    timer.join()
+
+
+def test_overflow_block_drops_after_timeout():
+    f = Filter('data', 'x', max_count=1, overflow_policy=Filter.BLOCK, block_timeout=0.1)
+    f.put(0)
+    f.put(1)
+    assert f.drain() == [0]
+    assert f.dropped_count == 1
+
+
+def test_overflow_spill_keeps_order(tmp_path):
+    f = Filter('data', 'x', max_count=2, overflow_policy=Filter.SPILL, spill_dir=str(tmp_path))
+    for i in range(5):
+        f.put({'i': i})
+    assert f.spilled_count == 3
+    assert f.data_count == 5
+    assert f.datas == [{'i': i} for i in range(5)]
+    assert f.get_many(max_count=3) == [{'i': i} for i in range(3)]
+    f.put({'i': 5})
+    assert f.drain() == [{'i': i} for i in range(3, 6)]
+    assert f.spilled_count == 0
+
+
+class _Record(dict):
+    def __init__(self, body):
+        super(_Record, self).__init__(data_name='data', url='https://a.com/x', method='GET')
+        self._body = body
+        self.closed = False
+
+    def get_json(self):
+        return self._body
+
+    def close(self):
+        self.closed = True
+
+
+def test_extract_records_failures():
+    f = Filter('data', 'x', extractor={'id': lambda row: row['items'][0]['id']})
+    record = _Record({'items': [{'id': 1}]})
+    data = f.extract(record)
+    assert data['rows'] == [{'id': 1}] and data['error'] is None
+    assert record.closed
+
+    data = f.extract(_Record({'items': []}))
+    assert data['rows'] == [] and data['error'].startswith('IndexError')
+    assert f.extract_error_count == 1
+    assert isinstance(f.last_extract_error, IndexError)
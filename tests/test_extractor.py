@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip('jsonpath')
+from jsonpath import jsonpath
+from airtest_ext.extractor import JsonPath, Extractor
+
+
+DATA = {
+    'data': {
+        'cursor': 'c2',
+        'items': [
+            {'id': 'a', 'note_card': {'title': 't1', 'interact_info': {'liked_count': '10'}}, 'tags': ['x', 'y']},
+            {'id': 'b', 'note_card': {'title': 't2', 'interact_info': {'liked_count': '20'}}, 'tags': []},
+            {'id': 'c', 'note_card': {'title': 't3'}},
+        ],
+        'with space': {'key': 1},
+    }
+}
+
+
+@pytest.mark.parametrize('expr', [
+    '$.data.cursor',
+    '$.data.items[0].id',
+    '$.data.items[*].id',
+    '$.data.items[*].note_card.interact_info.liked_count',
+    "$['data']['with space'].key",
+    '$.data.items[0].tags[*]',
+    '$.data.items[*].tags.*',
+])
+def test_compiled_path_matches_jsonpath(expr):
+    path = JsonPath(expr)
+    assert path._steps is not None
+    assert path.find(DATA) == (jsonpath(DATA, expr) or [])
+
+
+@pytest.mark.parametrize('expr', ['$.data.items[5].id', '$.data.missing', '$.data.items[*].missing'])
+def test_compiled_path_without_match(expr):
+    assert JsonPath(expr).find(DATA) == []
+
+
+@pytest.mark.parametrize('expr', ['$..title', '$.data.items[?(@.id=="b")].id', '$.data.items[0:2].id',
+                                  '$.data.items[-1].id'])
+def test_fallback_to_jsonpath(expr):
+    path = JsonPath(expr)
+    assert path._steps is None
+    assert path.find(DATA) == (jsonpath(DATA, expr) or [])
+
+
+def test_extract_single_and_multiple():
+    assert JsonPath('data.cursor').extract(DATA) == 'c2'
+    assert JsonPath('data.missing').extract(DATA, default=0) == 0
+    assert JsonPath('data.items[*].id').extract(DATA) == ['a', 'b', 'c']
+
+
+def test_extractor_rows():
+    extractor = Extractor({'id': 'id', 'title': 'note_card.title', 'likes': '$.note_card.interact_info.liked_count',
+                           'tag_count': lambda row: len(row.get('tags', []))}, rows='$.data.items[*]')
+    assert extractor.extract(DATA) == [
+        {'id': 'a', 'title': 't1', 'likes': '10', 'tag_count': 2},
+        {'id': 'b', 'title': 't2', 'likes': '20', 'tag_count': 0},
+        {'id': 'c', 'title': 't3', 'likes': None, 'tag_count': 0},
+    ]
+    assert Extractor({'cursor': 'data.cursor'}).extract('{"data": {"cursor": "c3"}}') == [{'cursor': 'c3'}]
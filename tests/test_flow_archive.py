@@ -0,0 +1,69 @@
+import gzip
+import pytest
+
+pytest.importorskip('mitmproxy')
+from mitmproxy import http
+from mitmproxy.test import tflow
+from airtest_ext.flow_archive import FlowArchive
+
+
+def _make_flow(url='https://api.example.com/feed?page=1', body=b'{"page": 1}'):
+    flow = tflow.tflow(resp=True)
+    flow.request = http.Request.make('POST', url)
+    flow.request.raw_content = body
+    flow.request.headers = http.Headers([(b'Host', b'api.example.com'), (b'Content-Length', b'11'),
+                                         (b'X-Token', b'a'), (b'X-Token', b'b')])
+    raw = gzip.compress(b'{"items": [1, 2, 3], "next": "cursor-2"}')
+    flow.response.raw_content = raw
+    flow.response.headers = http.Headers([(b'Content-Type', b'application/json'), (b'Content-Encoding', b'gzip'),
+                                          (b'Content-Length', str(len(raw)).encode())])
+    return flow
+
+
+def test_round_trip_keeps_headers_and_raw_content(tmp_path):
+    flow = _make_flow()
+    archive = FlowArchive(str(tmp_path / 'flows.dat'))
+    archive.append(flow, data_name='feed')
+    archive.close()
+
+    archive = FlowArchive(str(tmp_path / 'flows.dat'))
+    entries = archive.get_index()
+    assert len(entries) == 1
+    request, response = archive.read(entries[0])
+    assert request.method == 'POST'
+    assert request.url == flow.request.url
+    assert request.headers.fields == flow.request.headers.fields
+    assert request.raw_content == flow.request.raw_content
+    assert response.status_code == flow.response.status_code
+    assert response.reason == flow.response.reason
+    assert response.http_version == flow.response.http_version
+    assert response.headers.fields == flow.response.headers.fields
+    assert response.raw_content == flow.response.raw_content
+    assert response.get_text() == '{"items": [1, 2, 3], "next": "cursor-2"}'
+    archive.close()
+
+
+def test_append_snapshots_flow_before_write(tmp_path):
+    flow = _make_flow()
+    expected = flow.response.raw_content
+    archive = FlowArchive(str(tmp_path / 'flows.dat'))
+    archive.append(flow, data_name='feed')
+    flow.response.raw_content = b'changed after the hook returned'
+    archive.flush()
+    _, response = archive.read(archive.get_index()[0])
+    assert response.raw_content == expected
+    archive.close()
+
+
+def test_get_entries_by_method_and_url(tmp_path):
+    archive = FlowArchive(str(tmp_path / 'flows.dat'))
+    for page in range(3):
+        archive.append(_make_flow(url=f'https://api.example.com/feed?page={page}'), data_name='feed')
+    archive.append(_make_flow(url='https://api.example.com/feed?page=1', body=b'{"page": 2}'), data_name='feed')
+    entries = archive.get_entries('POST', 'https://api.example.com/feed?page=1')
+    assert [e['body_hash'] for e in entries] == [FlowArchive.get_body_hash(b'{"page": 1}'),
+                                                FlowArchive.get_body_hash(b'{"page": 2}')]
+    assert archive.get_entries('GET', 'https://api.example.com/feed?page=1') == []
+    assert [e['url'] for e in archive.find(url_regex=r'page=[02]')] == ['https://api.example.com/feed?page=0',
+                                                                        'https://api.example.com/feed?page=2']
+    archive.close()
@@ -0,0 +1,88 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip('mitmproxy')
+from mitmproxy import http
+from mitmproxy.test import tflow
+from airtest_ext.flow_archive import FlowArchive
+from airtest_ext.flow_replay import FlowReplayer
+
+
+def _make_flow(url, body, elapsed=0.0):
+    flow = tflow.tflow(resp=True)
+    flow.request = http.Request.make('GET', url)
+    flow.request.timestamp_start = 100.0
+    flow.response = http.Response.make(200, body, {'Content-Type': 'application/json'})
+    flow.response.timestamp_end = 100.0 + elapsed
+    return flow
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = FlowArchive(str(tmp_path / 'flows.dat'))
+    archive.append(_make_flow('https://a.com/feed', b'{"page": 1}'), data_name='feed')
+    archive.append(_make_flow('https://a.com/feed', b'{"page": 2}'), data_name='feed')
+    archive.append(_make_flow('https://a.com/slow', b'{"slow": true}', elapsed=0.2), data_name='slow')
+    yield archive
+    archive.close()
+
+
+@pytest.fixture
+def loop():
+    # mitmproxy 7的tflow需要当前线程有事件循环，用完后换上新的循环，不影响之后的测试
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def _request(url):
+    flow = tflow.tflow()
+    flow.request = http.Request.make('GET', url)
+    return flow
+
+
+def test_replays_recorded_responses_in_order(archive):
+    replayer = FlowReplayer(archive)
+    bodies = []
+    for _ in range(3):
+        flow = _request('https://a.com/feed')
+        replayer(flow)
+        bodies.append(flow.response.content)
+        assert flow.response.headers['Content-Length'] == str(len(flow.response.raw_content))
+    assert bodies == [b'{"page": 1}', b'{"page": 2}', b'{"page": 2}']
+    assert replayer.hit_count == 3
+
+
+def test_missing_request(archive):
+    flow = _request('https://a.com/missing')
+    FlowReplayer(archive)(flow)
+    assert flow.response.status_code == 404
+
+    flow = _request('https://a.com/missing')
+    replayer = FlowReplayer(archive, not_found_status=None)
+    replayer(flow)
+    assert flow.response is None
+    assert replayer.miss_count == 1
+
+
+def test_preserve_timing_does_not_block_loop(archive, loop):
+    replayer = FlowReplayer(archive, preserve_timing=True)
+
+    async def replay():
+        flows = [_request('https://a.com/slow') for _ in range(3)]
+        start_time = time.time()
+        pending = [replayer.request(flow) for flow in flows]
+        # 应答被推迟，request事件立即返回
+        assert time.time() - start_time < 0.1
+        assert all(flow.response is None for flow in flows)
+        await asyncio.gather(*[p for p in pending if p is not None])
+        while any(flow.response is None for flow in flows) and time.time() - start_time < 2:
+            await asyncio.sleep(0.01)
+        return flows, time.time() - start_time
+
+    flows, elapsed = loop.run_until_complete(replay())
+    assert all(flow.response.content == b'{"slow": true}' for flow in flows)
+    assert 0.15 < elapsed < 0.5
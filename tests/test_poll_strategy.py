@@ -0,0 +1,68 @@
+from airtest_ext.poll_strategy import LearnedPoll
+
+
+class _Template:
+    def __init__(self, filename, img=None, directory='/bot'):
+        self.filename = filename
+        self._img = img
+        if filename:
+            self._filepath = f'{directory}/{filename}'
+
+
+class _Feature:
+    def __init__(self, name, feature):
+        self.name = name
+        self.feature = feature
+
+
+def test_key_is_content_based():
+    poll = LearnedPoll()
+    poll.on_found({'b': _Template('b.png'), 'a': [_Template('a.png')]}, 1.0)
+    assert poll.get_delay({'a': [_Template('a.png')], 'b': _Template('b.png')}) == 1.0
+    assert poll.get_delay({'a': (_Template('a.png'),), 'b': _Template('b.png')}) is None
+
+    poll.on_found([_Feature('home', _Template('home.png'))], 2.0)
+    assert poll.get_delay([_Feature('home', _Template('home.png'))]) == 2.0
+    assert poll.get_delay([_Feature('other', _Template('home.png'))]) is None
+
+
+def test_same_filename_in_different_directories():
+    poll = LearnedPoll()
+    poll.on_found(_Template('home.png', directory='/bot/a'), 1.0)
+    poll.on_found(_Template('home.png', directory='/bot/b'), 3.0)
+    assert poll.get_delay(_Template('home.png', directory='/bot/a')) == 1.0
+    assert poll.get_delay(_Template('home.png', directory='/bot/b')) == 3.0
+
+
+def test_image_template_is_keyed_by_instance():
+    poll = LearnedPoll()
+    template = _Template(None, img=object())
+    poll.on_found(template, 1.0)
+    assert poll.get_delay(template) == 1.0
+    assert poll.get_delay(_Template(None, img=object())) is None
+
+
+def test_unidentifiable_query_is_not_learned():
+    poll = LearnedPoll()
+    poll.on_found([_Template('a.png'), _Template(None)], 1.0)
+    poll.on_found(object(), 1.0)
+    assert len(poll._delays) == 0
+    assert next(poll.intervals(object())) == 0.5
+
+
+def test_delay_moving_average():
+    poll = LearnedPoll(alpha=0.5)
+    poll.on_found(_Template('a.png'), 1.0)
+    poll.on_found(_Template('a.png'), 3.0)
+    assert poll.get_delay(_Template('a.png')) == 2.0
+
+
+def test_table_is_bounded_lru():
+    poll = LearnedPoll(max_size=2)
+    poll.on_found(_Template('a.png'), 1.0)
+    poll.on_found(_Template('b.png'), 1.0)
+    assert poll.get_delay(_Template('a.png')) == 1.0
+    poll.on_found(_Template('c.png'), 1.0)
+    assert poll.get_delay(_Template('b.png')) is None
+    assert poll.get_delay(_Template('a.png')) == 1.0
+    assert poll.get_delay(_Template('c.png')) == 1.0
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('airtest')
+from airtest_ext.utils import estimate_scroll_offset, ScreenStableChecker, _get_adaptive_swipe_end
+
+
+def _make_content(height=2000, width=360, seed=0):
+    rng = np.random.RandomState(seed)
+    content = (rng.rand(height // 8, width // 8) * 255).astype('uint8')
+    return np.kron(content, np.ones((8, 8), dtype='uint8'))
+
+
+def _screen(content, top, height=640):
+    return np.stack([content[top:top + height]] * 3, axis=-1)
+
+
+@pytest.mark.parametrize('scroll', [40, 200, 400])
+def test_estimate_scroll_offset(scroll):
+    content = _make_content()
+    offset = estimate_scroll_offset(_screen(content, 100), _screen(content, 100 + scroll), expected=(0, -scroll))
+    assert offset is not None
+    assert abs(offset[0]) < 2 and abs(offset[1] + scroll) < 2
+
+
+def test_estimate_scroll_offset_in_rect():
+    content = _make_content()
+    prev_screen = _screen(content, 100)
+    screen = _screen(content, 160)
+    # 固定的标题栏不随列表滚动
+    screen[:64] = prev_screen[:64]
+    offset = estimate_scroll_offset(prev_screen, screen, in_rect=((-1, -0.6), (1, 1)), expected=(0, -60))
+    assert abs(offset[1] + 60) < 2
+
+
+def test_estimate_scroll_offset_unmeasurable():
+    prev_screen = _screen(_make_content(), 0)
+    # 空白页（如加载中）及尺寸不同的截图无法估计
+    assert estimate_scroll_offset(prev_screen, np.full_like(prev_screen, 255)) is None
+    assert estimate_scroll_offset(prev_screen, prev_screen[:320]) is None
+
+
+def test_adaptive_swipe_end():
+    screen = np.zeros((1000, 500, 3), dtype='uint8')
+    v, v2 = (250, 800), (250, 400)
+    assert _get_adaptive_swipe_end(v, v2, (0, -700), screen) == v2
+    # 移动不足：加长，最多max_scale倍，终点不超出屏幕
+    assert _get_adaptive_swipe_end(v, v2, (0, -400), screen) == (250, 0 + 1)
+    # 移动过多：缩短
+    end = _get_adaptive_swipe_end(v, v2, (0, -960), screen)
+    assert 400 < end[1] < 800
+    assert _get_adaptive_swipe_end(v, v2, (0, -2000), screen, min_scale=0.5) == (250, 600)
+    # 无法估计：恢复为原终点
+    assert _get_adaptive_swipe_end(v, end, None, screen, base_v2=v2) == v2
+
+
+def test_screen_stable_checker():
+    content = _make_content()
+    checker = ScreenStableChecker(stable_time=0.3)
+    assert not checker.update(_screen(content, 0), now=0) and checker.changed
+    assert not checker.update(_screen(content, 100), now=0.1) and checker.changed
+    assert not checker.update(_screen(content, 100), now=0.2) and not checker.changed
+    assert checker.update(_screen(content, 100), now=0.5)
+    assert not checker.update(None, now=0.6) and checker.changed